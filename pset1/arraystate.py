@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+
+import numpy as np
+
+from piecestate import PieceState
+
+
+class ArrayPieceState(PieceState):
+    """
+    PieceState backed by a single (peers x pieces) integer matrix.
+
+    matrix[peer_id.num, piece_id] is the number of blocks of piece_id that
+    peer_id has.  Completion and download application are array operations;
+    the available Bitsets are kept alongside for PeerInfo.
+
+    The matrix starts out int64 and switches to float64 the first time a
+    fractional block count arrives (agents may upload fractional bandwidth),
+    so the counts stay exactly what the python engine's lists hold.
+    """
+    def __init__(self, conf, peer_ids, init_pieces):
+        self.conf = conf
+        self.peer_ids = peer_ids[:]
+        self.matrix = np.array(init_pieces,
+                               dtype=np.int64).reshape(len(peer_ids),
+                                                       conf.num_pieces)
+        # Read-only copy of matrix[num], until that row changes
+        self.views = [None] * len(peer_ids)
+        self.init_available()
+
+    def count_pieces(self):
+        return (self.matrix == self.conf.blocks_per_piece).sum(axis=0)
+
+    def rarity(self):
+        counts = self.piece_counts.copy()
+        counts.flags.writeable = False
+        return counts
+
+    def completed_pieces(self, peer_id):
+        row = self.matrix[peer_id.num]
+        return np.flatnonzero(row == self.conf.blocks_per_piece).tolist()
+
+    def pieces(self, peer_id):
+        """A read-only snapshot of the peer's row of the matrix.  Like the
+        python engine's tuples, it doesn't change as later blocks arrive, and
+        is only copied again after the peer gets new blocks."""
+        num = peer_id.num
+        view = self.views[num]
+        if view is None:
+            view = self.views[num] = self.matrix[num].copy()
+            view.flags.writeable = False
+        return view
+
+    def blocks_of(self, peer_id, piece_id):
+        # A python int, or a float once the matrix has gone float
+        return self.matrix[peer_id.num, piece_id].item()
+
+    def add_blocks(self, gains):
+        if len(gains) == 0:
+            return
+        rows = np.array([pid.num for (pid, _, _) in gains])
+        cols = np.array([piece_id for (_, piece_id, _) in gains])
+        blocks = np.array([b for (_, _, b) in gains])
+        if (self.matrix.dtype.kind == "i" and
+                (blocks != np.floor(blocks)).any()):
+            # add.at would truncate 2.5 blocks to 2
+            self.matrix = self.matrix.astype(np.float64)
+
+        np.add.at(self.matrix, (rows, cols), blocks)
+        for (pid, _, _) in gains:
+            self.views[pid.num] = None
+        finished = self.matrix[rows, cols] == self.conf.blocks_per_piece
+        for i in np.flatnonzero(finished):
+            self.finish_piece(gains[i][0], gains[i][1])
+
+    def scan_done_peers(self):
+        done = (self.matrix >= self.conf.blocks_per_piece).all(axis=1)
+        return [self.peer_ids[i] for i in np.flatnonzero(done)]
@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+
+"""
+Benchmarks simulator throughput over a grid of fixed-seed scenarios:
+swarm sizes x number of pieces x agent mixes.
+
+Each scenario runs in a fresh process, so the peak RSS reported is its own.
+For every scenario we report rounds/sec, wall time, time per phase (see
+instrument.py) and peak RSS, and can write everything to a JSON file to
+compare against a run from another commit:
+
+    python bench.py --suite quick --output before.json
+    ... change things ...
+    python bench.py --suite quick --output after.json --compare before.json
+
+--startup instead times a cold start of sim.py (one round) per mix, and
+reports the slowest imports from python -X importtime.
+"""
+
+import sys
+import json
+import logging
+import collections
+import platform
+import resource
+import subprocess
+import multiprocessing
+from optparse import OptionParser
+from timeit import default_timer as clock
+
+import sim
+from instrument import make_timings
+
+
+# Mix name -> the classes of the peers that aren't seeds.  One peer in ten
+# (at least one) is a Seed.
+MIXES = {
+    "Dummy": ["Dummy"],
+    "Seed": ["Seed"],
+    "RSCTorrentStd": ["RSCTorrentStd"],
+    "RSCTorrentTyrant": ["RSCTorrentTyrant"],
+    "RSCTorrentTourney": ["RSCTorrentTourney"],
+    "RSCTorrentPropShare": ["RSCTorrentPropShare"],
+    "Mixed": ["Dummy", "RSCTorrentStd", "RSCTorrentTyrant",
+              "RSCTorrentTourney", "RSCTorrentPropShare"],
+}
+
+# suite -> (peer counts, piece counts, mixes)
+SUITES = {
+    "quick": ([10, 50], [3, 100], ["Dummy", "RSCTorrentStd", "Mixed"]),
+    "full": ([10, 100, 1000], [3, 100, 10000], sorted(MIXES.keys())),
+}
+
+
+def agent_names(mix, num_peers):
+    """The agent class names for num_peers peers of this mix"""
+    num_seeds = max(1, num_peers // 10)
+    classes = MIXES[mix]
+    names = [classes[i % len(classes)] for i in range(num_peers - num_seeds)]
+    return names + ["Seed"] * num_seeds
+
+
+def run_scenario(scenario):
+    """Run one scenario (a dict) and return its measurements as a dict"""
+    options, _ = sim.make_parser().parse_args([])
+    options.num_pieces = scenario["pieces"]
+    options.max_round = scenario["max_round"]
+    options.engine = scenario["engine"]
+    options.scheduler = scenario.get("scheduler", "all")
+    options.timing = True
+    config = sim.make_config(options,
+                             agent_names(scenario["mix"], scenario["peers"]))
+
+    s = sim.Sim(config)
+    s.seed_iteration(scenario["seed"])
+    s.timings = make_timings(True)
+    started = clock()
+    history = s.run_sim_once()
+    wall = clock() - started
+
+    rounds = history.num_rounds
+    result = dict(scenario)
+    result.update({
+        "rounds": rounds,
+        "wall": wall,
+        "rounds_per_sec": rounds / wall if wall > 0 else None,
+        "phases": s.timings.phases,
+        # kilobytes on Linux
+        "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    })
+    return result
+
+
+def run_isolated(scenario):
+    """Run a scenario in a fresh worker process.  If the sim raises (e.g. an
+    agent makes an illegal upload), the result records the error."""
+    pool = multiprocessing.Pool(1)
+    try:
+        return pool.apply(run_scenario, (scenario,))
+    except Exception as e:
+        result = dict(scenario)
+        result["error"] = "%s: %s" % (e.__class__.__name__, e)
+        return result
+    finally:
+        pool.close()
+        pool.join()
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"],
+                                       universal_newlines=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def startup_profile(mix, repeats):
+    """
+    Run sim.py for one round of mix in a fresh interpreter, repeats times.
+
+    Returns a dict with the best wall time, the total import time and the
+    top-level imports (name, seconds), slowest first, of that run.
+    """
+    cmd = [sys.executable, "-X", "importtime", "sim.py",
+           "--loglevel", "warning", "--max-round", "1"]
+    cmd += ["%s,%d" % (name, count) for (name, count) in
+            sorted(collections.Counter(agent_names(mix, 10)).items())]
+    best = None
+    for _ in range(repeats):
+        started = clock()
+        proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL,
+                                stderr=subprocess.PIPE,
+                                universal_newlines=True)
+        err = proc.communicate()[1]
+        wall = clock() - started
+        if proc.returncode != 0:
+            return {"mix": mix, "error": err.strip().splitlines()[-1]}
+        if best is None or wall < best[0]:
+            best = (wall, err)
+
+    (wall, err) = best
+    imports = []
+    for line in err.splitlines():
+        # "import time: self [us] | cumulative | imported package"
+        if not line.startswith("import time:"):
+            continue
+        fields = line[len("import time:"):].split("|")
+        if len(fields) != 3 or not fields[1].strip().isdigit():
+            continue
+        name = fields[2].rstrip()
+        if name.startswith("  "):
+            continue   # imported by another module
+        imports.append((name.strip(), int(fields[1]) / 1e6))
+    imports.sort(key=lambda imp: imp[1], reverse=True)
+    return {"mix": mix, "wall": wall,
+            "import_time": sum(t for (name, t) in imports),
+            "imports": imports}
+
+
+def print_startup(results, top):
+    print("%-24s %10s %12s  %s" % ("mix", "wall (s)", "imports (s)",
+                                    "slowest imports (ms)"))
+    for r in results:
+        if "error" in r:
+            print("%-24s %s" % (r["mix"], r["error"]))
+            continue
+        slowest = ", ".join("%s %.1f" % (name, t * 1000)
+                            for (name, t) in r["imports"][:top])
+        print("%-24s %10.3f %12.3f  %s" % (r["mix"], r["wall"],
+                                           r["import_time"], slowest))
+
+
+def scenario_key(result):
+    key = "%(mix)s/%(peers)dp/%(pieces)dpc/%(engine)s" % result
+    if result.get("scheduler", "all") != "all":
+        key += "/" + result["scheduler"]
+    return key
+
+
+def compare(results, old_path):
+    """Print rounds/sec of results next to those in the JSON file old_path"""
+    with open(old_path) as f:
+        old = dict((scenario_key(r), r) for r in json.load(f)["results"])
+    print("%-40s %12s %12s %8s" % ("scenario", "old r/s", "new r/s", "speedup"))
+    for r in results:
+        key = scenario_key(r)
+        if key not in old:
+            continue
+        before = old[key].get("rounds_per_sec")
+        after = r.get("rounds_per_sec")
+        if before and after:
+            print("%-40s %12.1f %12.1f %7.2fx" % (key, before, after,
+                                                  after / before))
+
+
+def int_list(s):
+    return [int(x) for x in s.split(",")]
+
+
+def main(args):
+    parser = OptionParser(usage="Usage: %prog [options]")
+    parser.add_option("--suite",
+                      dest="suite", default="quick", choices=sorted(SUITES),
+                      help="Scenario grid to run: %s" % ", ".join(sorted(SUITES)))
+    parser.add_option("--peers",
+                      dest="peers", default=None,
+                      help="Comma-separated peer counts (overrides the suite)")
+    parser.add_option("--pieces",
+                      dest="pieces", default=None,
+                      help="Comma-separated piece counts (overrides the suite)")
+    parser.add_option("--mixes",
+                      dest="mixes", default=None,
+                      help="Comma-separated agent mixes: %s" % ", ".join(sorted(MIXES)))
+    parser.add_option("--max-round",
+                      dest="max_round", default=50, type="int",
+                      help="Limit on rounds per scenario")
+    parser.add_option("--engine",
+                      dest="engine", default="python",
+                      choices=["python", "numpy"],
+                      help="Piece-state engine to benchmark")
+    parser.add_option("--scheduler",
+                      dest="scheduler", default="all",
+                      choices=["all", "active"],
+                      help="Which peers the sim calls each round (see sim.py --help)")
+    parser.add_option("--seed",
+                      dest="seed", default=0, type="int",
+                      help="Seed every scenario is run with")
+    parser.add_option("--output",
+                      dest="output", default=None,
+                      help="Write the results as JSON to this file")
+    parser.add_option("--compare",
+                      dest="compare", default=None,
+                      help="JSON results from an earlier run to compare against")
+    parser.add_option("--startup",
+                      dest="startup", action="store_true", default=False,
+                      help="Time cold starts (imports) of sim.py per mix instead")
+    parser.add_option("--repeats",
+                      dest="repeats", default=5, type="int",
+                      help="With --startup, runs per mix (the fastest is kept)")
+    (options, args) = parser.parse_args(args[1:])
+
+    logging.basicConfig(level=logging.WARNING, format="%(message)s")
+
+    peers, pieces, mixes = SUITES[options.suite]
+    if options.peers:
+        peers = int_list(options.peers)
+    if options.pieces:
+        pieces = int_list(options.pieces)
+    if options.mixes:
+        mixes = options.mixes.split(",")
+        for mix in mixes:
+            if mix not in MIXES:
+                parser.error("Unknown mix: %s" % mix)
+
+    if options.startup:
+        results = [startup_profile(mix, options.repeats) for mix in mixes]
+        print_startup(results, 4)
+        if options.output:
+            with open(options.output, "w") as f:
+                json.dump({"commit": git_commit(),
+                           "python": platform.python_version(),
+                           "startup": results}, f, indent=2, sort_keys=True)
+        return
+
+    results = []
+    print("%-40s %8s %10s %10s %12s" % ("scenario", "rounds", "wall (s)",
+                                         "rounds/s", "peak RSS MB"))
+    for mix in mixes:
+        for num_peers in peers:
+            for num_pieces in pieces:
+                r = run_isolated({"mix": mix, "peers": num_peers,
+                                  "pieces": num_pieces,
+                                  "max_round": options.max_round,
+                                  "engine": options.engine,
+                                  "scheduler": options.scheduler,
+                                  "seed": options.seed})
+                results.append(r)
+                if "error" in r:
+                    print("%-40s %s" % (scenario_key(r), r["error"]))
+                    continue
+                print("%-40s %8d %10.3f %10.1f %12.1f" % (
+                    scenario_key(r), r["rounds"], r["wall"],
+                    r["rounds_per_sec"] or 0, r["peak_rss_kb"] / 1024.0))
+                sys.stdout.flush()
+
+    if options.output:
+        with open(options.output, "w") as f:
+            json.dump({"commit": git_commit(),
+                       "python": platform.python_version(),
+                       "results": results}, f, indent=2, sort_keys=True)
+
+    if options.compare:
+        compare(results, options.compare)
+
+
+if __name__ == "__main__":
+    main(sys.argv)
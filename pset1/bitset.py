@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+
+# Immutable sets of piece ids, stored as the bits of a single int.
+
+import binascii
+import operator
+
+
+class Bitset(object):
+    """
+    An immutable set of non-negative ints (piece ids): bit i of self.bits is
+    set if i is in the set.
+
+    &, |, - and ^ are one int operation each, len() is a popcount and
+    membership is a shift, so "pieces this peer has that I still need" is
+        peer.available_pieces - self.available
+    rather than a loop over python sets.  Iterating yields the ids in
+    increasing order.
+
+    PeerInfo.available_pieces used to be a set, so Bitset stands in for one:
+    ids may be any ints, numpy ints included; the operators and the named
+    set methods (intersection, union, ...) take a Bitset or any iterable of
+    ids, on either side, and return a Bitset.  It is immutable, so there is
+    no add() or discard(), and it only compares equal to another Bitset.
+    """
+    __slots__ = ('bits', '_len')
+
+    def __init__(self, bits=0):
+        self.bits = bits
+        self._len = None
+
+    @classmethod
+    def from_ids(cls, ids):
+        bits = 0
+        for i in ids:
+            bits |= 1 << operator.index(i)
+        return cls(bits)
+
+    @classmethod
+    def full(cls, n):
+        """The set {0, 1, ..., n-1}"""
+        return cls((1 << n) - 1)
+
+    def with_id(self, i):
+        """A new Bitset that also contains i"""
+        i = operator.index(i)
+        added = Bitset(self.bits | (1 << i))
+        if self._len is not None:
+            # Keep the count, so len() stays O(1) as pieces get added
+            added._len = self._len + (0 if i in self else 1)
+        return added
+
+    def __contains__(self, i):
+        # numpy ints would try to squeeze self.bits into a C long
+        i = operator.index(i)
+        return i >= 0 and (self.bits >> i) & 1 == 1
+
+    def __len__(self):
+        if self._len is None:
+            self._len = bin(self.bits).count("1")
+        return self._len
+
+    def __bool__(self):
+        return self.bits != 0
+
+    def __iter__(self):
+        bits = self.bits
+        while bits:
+            low = bits & -bits
+            yield low.bit_length() - 1
+            bits ^= low
+
+    def __and__(self, other):
+        return Bitset(self.bits & _bits(other))
+
+    def __or__(self, other):
+        return Bitset(self.bits | _bits(other))
+
+    def __sub__(self, other):
+        return Bitset(self.bits & ~_bits(other))
+
+    def __xor__(self, other):
+        return Bitset(self.bits ^ _bits(other))
+
+    # set & Bitset and friends: set's own operators give up on a Bitset
+    __rand__ = __and__
+    __ror__ = __or__
+    __rxor__ = __xor__
+
+    def __rsub__(self, other):
+        return Bitset(_bits(other) & ~self.bits)
+
+    def __le__(self, other):
+        return self.issubset(other)
+
+    def __ge__(self, other):
+        return self.issuperset(other)
+
+    def intersection(self, *others):
+        bits = self.bits
+        for other in others:
+            bits &= _bits(other)
+        return Bitset(bits)
+
+    def union(self, *others):
+        bits = self.bits
+        for other in others:
+            bits |= _bits(other)
+        return Bitset(bits)
+
+    def difference(self, *others):
+        bits = self.bits
+        for other in others:
+            bits &= ~_bits(other)
+        return Bitset(bits)
+
+    def symmetric_difference(self, other):
+        return self ^ other
+
+    def isdisjoint(self, other):
+        return self.bits & _bits(other) == 0
+
+    def issubset(self, other):
+        return self.bits & ~_bits(other) == 0
+
+    def issuperset(self, other):
+        return _bits(other) & ~self.bits == 0
+
+    def copy(self):
+        # Immutable, so this is only here for code written against sets
+        return self
+
+    def __eq__(self, other):
+        return isinstance(other, Bitset) and self.bits == other.bits
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self.bits)
+
+    def to_mask(self, n):
+        """numpy bool array of length n, True at the ids in the set (all of
+        which must be < n)"""
+        import numpy as np
+        nbytes = (n + 7) // 8
+        packed = binascii.unhexlify("%0*x" % (2 * nbytes, self.bits))
+        # Big-endian bytes, most significant bit first: reverse to index by id
+        bits = np.unpackbits(np.frombuffer(packed, dtype=np.uint8))[::-1]
+        return bits[:n].astype(bool)
+
+    def __repr__(self):
+        return "Bitset(%s)" % list(self)
+
+
+def _bits(ids):
+    """The bits of a Bitset, or of a Bitset built from any iterable of ids"""
+    if isinstance(ids, Bitset):
+        return ids.bits
+    return Bitset.from_ids(ids).bits
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import json
+import errno
+import hashlib
+
+
+# Config entries that can't change an iteration's result
+IGNORED_KEYS = set(["agent_classes", "iters", "workers", "seed", "timing",
+                    "history_spill", "cache_dir", "cache_size",
+                    "trusted_agents", "validation_sample"])
+
+# The simulator's own modules; a change to any of them invalidates the cache
+CORE_MODULES = ["sim", "history", "messages", "peer", "util", "stats",
+                "piecestate", "arraystate", "planner", "bitset",
+                "reciprocation", "tyrantstate", "peerids"]
+
+
+# When the cache is over budget, evict down to this share of it, so the
+# next misses don't each trigger another scan
+LOW_WATER = 0.9
+
+
+def disk_usage(st):
+    """Bytes st's file takes on disk (allocated blocks, not its length)"""
+    return st.st_blocks * 512
+
+
+class ResultCache:
+    """
+    On-disk cache of iteration summaries (uploaded blocks and completion
+    rounds), keyed by a hash of the config, the iteration seed and the source
+    of the agents and the simulator.
+
+    One JSON file per entry.  A hit touches the file, and when the directory
+    grows past max_bytes of disk the least recently used entries are deleted.
+
+    The directory is only scanned when the running total of disk used says
+    it may be over budget.  The total starts from a scan on the first put()
+    and is reset by each eviction, which also picks up entries written by
+    other processes.
+    """
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.sources = dict()   # agent class names -> source digest
+        self.used = None        # bytes on disk, as of the last scan + puts
+        try:
+            os.makedirs(directory)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+
+    def source_digest(self, config):
+        """Hash of the agent source files and the sim's own modules"""
+        names = tuple(sorted(config.agent_classes))
+        if names not in self.sources:
+            import inspect
+            paths = set()
+            for cls in config.agent_classes.values():
+                paths.add(inspect.getsourcefile(cls))
+            for name in CORE_MODULES:
+                module = sys.modules.get(name)
+                if module is not None:
+                    paths.add(inspect.getsourcefile(module))
+            h = hashlib.sha1()
+            for path in sorted(paths):
+                with open(path, "rb") as f:
+                    h.update(f.read())
+            self.sources[names] = h.hexdigest()
+        return self.sources[names]
+
+    def key(self, config, seed):
+        items = sorted((k, v) for (k, v) in config.__dict__.items()
+                       if k not in config._init_keys and k not in IGNORED_KEYS)
+        h = hashlib.sha1()
+        h.update(repr(items).encode("utf-8"))
+        h.update(("seed=%d" % seed).encode("ascii"))
+        h.update(self.source_digest(config).encode("ascii"))
+        return h.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key + ".json")
+
+    def get(self, key):
+        """Return the cached (uploaded_blocks, completion_rounds), or None"""
+        path = self.path(key)
+        try:
+            with open(path) as f:
+                entry = json.load(f)
+            os.utime(path, None)   # most recently used
+        except (IOError, OSError, ValueError):
+            return None
+        return (entry["uploaded_blocks"], entry["completion_rounds"])
+
+    def put(self, key, uploaded_blocks, completion_rounds):
+        import tempfile
+        # Write then rename, so other processes never see half an entry
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump({"uploaded_blocks": uploaded_blocks,
+                       "completion_rounds": completion_rounds}, f)
+        path = self.path(key)
+        os.rename(tmp, path)
+        if self.used is not None:
+            try:
+                self.used += disk_usage(os.stat(path))
+            except OSError:
+                pass   # another process evicted it already
+        if self.used is None or self.used > self.max_bytes:
+            self.evict()
+
+    def evict(self):
+        """Scan the directory and, if it's over max_bytes, delete least
+        recently used entries until it's under LOW_WATER of that"""
+        entries = []
+        total = 0
+        for name in os.listdir(self.directory):
+            if not name.endswith(".json"):
+                continue
+            try:
+                st = os.stat(os.path.join(self.directory, name))
+            except OSError:
+                continue   # another process evicted it
+            size = disk_usage(st)
+            entries.append((st.st_mtime, size, name))
+            total += size
+        if total > self.max_bytes:
+            entries.sort()
+            for (mtime, size, name) in entries:
+                if total <= self.max_bytes * LOW_WATER:
+                    break
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except OSError:
+                    pass
+                total -= size
+        self.used = total
+
+
+# (directory, max_bytes) -> ResultCache, so the iterations a process runs
+# share the running size and the source digests
+_caches = dict()
+
+
+def make_cache(config):
+    """The ResultCache for config, or None if caching is off"""
+    if not config.cache_dir:
+        return None
+    key = (config.cache_dir, config.cache_size * 1024 * 1024)
+    if key not in _caches:
+        _caches[key] = ResultCache(*key)
+    return _caches[key]
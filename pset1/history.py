@@ -1,7 +1,73 @@
-#!/usr/bin/python
+#!/usr/bin/env python3
 
-import copy
-import pprint
+import pickle
+from array import array
+
+
+class DownloadLog:
+    """
+    Columnar record of all the downloads _to_ one peer.
+
+    Parallel lists, one entry per Download, in the order they happened:
+        from_ids, blocks
+
+    round_start[r]: index of the first entry for the r'th kept round
+    cum_blocks[i]: total blocks in entries [0, i) -- prefix sums, so the
+         blocks received over any window of rounds is one subtraction.
+         received_from() walks the window's entries instead: O(entries in
+         the window), which for the round or two agents ask about is a
+         handful.
+
+    drop_oldest_round() forgets the oldest round; dropped counts the entries
+    forgotten so far.  Indices in round_start count the dropped entries too.
+    """
+    def __init__(self):
+        self.from_ids = []
+        self.blocks = []       # agents may upload fractional bandwidth
+        self.round_start = array('l')
+        self.cum_blocks = [0]
+        self.dropped = 0
+
+    def append_round(self, downloads):
+        self.round_start.append(self.dropped + len(self.blocks))
+        for d in downloads:
+            self.from_ids.append(d.from_id)
+            self.blocks.append(d.blocks)
+            self.cum_blocks.append(self.cum_blocks[-1] + d.blocks)
+
+    def window_start(self, n_rounds):
+        """Index of the first entry in the last n_rounds rounds (the end,
+        an empty window, if n_rounds <= 0)"""
+        if n_rounds <= 0:
+            return len(self.blocks)
+        first = len(self.round_start) - n_rounds
+        if first <= 0:
+            return 0
+        return self.round_start[first] - self.dropped
+
+    def blocks_received(self, n_rounds):
+        """Total blocks received over the last n_rounds rounds"""
+        return self.cum_blocks[-1] - self.cum_blocks[self.window_start(n_rounds)]
+
+    def received_from(self, n_rounds):
+        """dict : from_id -> blocks received over the last n_rounds rounds.
+        Walks the entries in the window."""
+        ans = dict()
+        for i in range(self.window_start(n_rounds), len(self.blocks)):
+            from_id = self.from_ids[i]
+            ans[from_id] = ans.get(from_id, 0) + self.blocks[i]
+        return ans
+
+    def drop_oldest_round(self):
+        if len(self.round_start) > 1:
+            n = self.round_start[1] - self.dropped
+        else:
+            n = len(self.blocks)
+        del self.from_ids[:n]
+        del self.blocks[:n]
+        del self.cum_blocks[:n]
+        del self.round_start[0]
+        self.dropped += n
 
 
 class AgentHistory:
@@ -14,23 +80,54 @@ class AgentHistory:
     history.uploads: [[Upload objects for round]]  (one sublist for each round)
          All the downloads _from_ this agent.
 
+    history.piece_counts: read-only sequence, one entry per piece
+         How many peers in the swarm (this one included) have each piece
+         available at the start of the current round.
+
+    history.received_from(n_rounds), history.blocks_received(n_rounds):
+         Windowed totals over the downloads _to_ this agent, answered from
+         the columnar DownloadLog without walking the Download objects.
+
+    When the sim runs with --history-window, downloads and uploads only hold
+    the most recent rounds; use current_round() rather than their length.
+
     """
-    def __init__(self, peer_id, downloads, uploads):
+    def __init__(self, peer_id, downloads, uploads, piece_counts=None,
+                 log=None, num_rounds=None):
         """
         Pull out just the info for peer_id.
         """
         self.uploads = uploads
         self.downloads = downloads
         self.peer_id = peer_id
+        self.piece_counts = piece_counts
+        if num_rounds is None:
+            num_rounds = len(downloads)
+        self.num_rounds = num_rounds
+        if log is None:
+            log = DownloadLog()
+            for ds in downloads:
+                log.append_round(ds)
+        self.log = log
+
+    def received_from(self, n_rounds):
+        """dict : peer_id -> blocks downloaded from that peer over the
+        last n_rounds rounds.  Peers we got nothing from are left out."""
+        return self.log.received_from(n_rounds)
+
+    def blocks_received(self, n_rounds):
+        """Total blocks downloaded over the last n_rounds rounds"""
+        return self.log.blocks_received(n_rounds)
 
     def last_round(self):
-        return len(self.downloads)-1
+        return self.num_rounds-1
 
     def current_round(self):
         """ 0 is the first """
-        return len(self.downloads)
+        return self.num_rounds
 
     def __repr__(self):
+        import pprint
         return "AgentHistory(downloads=%s, uploads=%s)" % (
             pprint.pformat(self.downloads),
             pprint.pformat(self.uploads))
@@ -38,67 +135,127 @@ class AgentHistory:
 
 class History:
     """History of the whole sim"""
-    def __init__(self, peer_ids, upload_rates):
+    def __init__(self, peer_ids, upload_rates, window=None, spill=None):
         """
+        peer_ids: the PeerTable's ids, in number order.  The per-peer lists
+        below are indexed by PeerId.num.
+
         uploads:
-                   dict : peer_id -> [[uploads] -- one list per round]
+                   [[uploads] -- one list per round], for each peer
         downloads:
-                   dict : peer_id -> [[downloads] -- one list per round]
+                   [[downloads] -- one list per round], for each peer
+        logs:
+                   DownloadLog of the downloads to each peer
+        uploaded_total, downloaded_total:
+                   blocks each peer sent / received so far
                    
         Keep track of the uploads _from_ and downloads _to_ the
         specified peer id.
+
+        window: if set, only the last window rounds are kept in downloads,
+        uploads and the logs.  Older rounds only live on in the running
+        totals and round_done (and in spill, if given).
+        spill: open file that evicted rounds are pickled to, one
+        (round, downloads, uploads) tuple per round.  See read_spill().
         """
         self.upload_rates = upload_rates  # peer_id -> up_bw
         self.peer_ids = peer_ids[:]
+        self.window = window
+        self.spill = spill
+        self.num_rounds = 0
+        self.first_round = 0   # oldest round still kept
 
         self.round_done = dict()   # peer_id -> round finished
-        self.downloads = dict((pid, []) for pid in peer_ids)
-        self.uploads = dict((pid, []) for pid in peer_ids)
+        n = len(peer_ids)
+        self.downloads = [[] for _ in range(n)]
+        self.uploads = [[] for _ in range(n)]
+        self.logs = [DownloadLog() for _ in range(n)]
+        self.uploaded_total = [0] * n
+        self.downloaded_total = [0] * n
 
     def update(self, dls, ups):
         """
-        dls: dict : peer_id -> [downloads] -- downloads for this round
-        ups: dict : peer_id -> [uploads] -- uploads for this round
+        dls: [downloads] -- downloads for this round, for each peer
+        ups: [uploads] -- uploads for this round, for each peer
 
         append these downloads to to the history
         """
-        for pid in self.peer_ids:
-            self.downloads[pid].append(dls[pid])
-            self.uploads[pid].append(ups[pid])
+        uploaded_total = self.uploaded_total
+        for num in range(len(self.peer_ids)):
+            ds = dls[num]
+            self.downloads[num].append(ds)
+            self.uploads[num].append(ups[num])
+            self.logs[num].append_round(ds)
+            for d in ds:
+                uploaded_total[d.from_id.num] += d.blocks
+                self.downloaded_total[num] += d.blocks
+        self.num_rounds += 1
+
+        if self.window and self.num_rounds - self.first_round > self.window:
+            self.evict_oldest_round()
+
+    def evict_oldest_round(self):
+        """Drop the oldest kept round, writing it to the spill file first"""
+        if self.spill is not None:
+            dls = dict((pid, ds[0]) for (pid, ds) in zip(self.peer_ids, self.downloads))
+            ups = dict((pid, us[0]) for (pid, us) in zip(self.peer_ids, self.uploads))
+            pickle.dump((self.first_round, dls, ups), self.spill,
+                        pickle.HIGHEST_PROTOCOL)
+        for num in range(len(self.peer_ids)):
+            del self.downloads[num][0]
+            del self.uploads[num][0]
+            self.logs[num].drop_oldest_round()
+        self.first_round += 1
 
     def peer_is_done(self, round, peer_id):
         # Only save the _first_ round where we hear this
         if peer_id not in self.round_done:
             self.round_done[peer_id] = round
 
-    def peer_history(self, peer_id):
-        return AgentHistory(peer_id, self.downloads[peer_id], self.uploads[peer_id])
+    def peer_history(self, peer_id, piece_counts=None):
+        num = peer_id.num
+        return AgentHistory(peer_id, self.downloads[num], self.uploads[num],
+                            piece_counts, self.logs[num], self.num_rounds)
 
     def last_round(self):
         """index of the last completed round"""
-        p = self.peer_ids[0]
-        return len(self.downloads[p])-1
+        return self.num_rounds-1
+
+    def pretty_lines_for_round(self, r):
+        yield "\nRound %s:\n" % r
+        if r < self.first_round:
+            yield "(not kept -- outside the history window)\n"
+            return
+        for (peer_id, downloads) in zip(self.peer_ids, self.downloads):
+            for d in downloads[r - self.first_round]:
+                yield "%s downloaded %d blocks of piece %d from %s\n" % (
+                    peer_id, d.blocks, d.piece, d.from_id)
 
     def pretty_for_round(self, r):
-        s = "\nRound %s:\n" % r
-        for peer_id in self.peer_ids:
-            ds = self.downloads[peer_id][r]
-            stringify = lambda d: "%s downloaded %d blocks of piece %d from %s\n" % (
-                peer_id, d.blocks, d.piece, d.from_id)
-            s += "".join(map(stringify, ds))
-        return s
+        return "".join(self.pretty_lines_for_round(r))
 
     def pretty(self):
-        s = "History\n"
-        for r in range(self.last_round()+1):
-            s += self.pretty_for_round(r)
-        return s
+        lines = ["History\n"]
+        if self.first_round > 0:
+            lines.append("(rounds before %d not kept)\n" % self.first_round)
+        for r in range(self.first_round, self.last_round()+1):
+            lines.extend(self.pretty_lines_for_round(r))
+        return "".join(lines)
 
     def __repr__(self):
+        import pprint
         return """History(
 uploads=%s
 downloads=%s
 )""" % (
-    pprint.pformat(self.uploads),
-    pprint.pformat(self.downloads))
+    pprint.pformat(dict(zip(self.peer_ids, self.uploads))),
+    pprint.pformat(dict(zip(self.peer_ids, self.downloads))))
+
 
+def read_spill(f):
+    """Yield the (round, downloads, uploads) tuples History spilled to f"""
+    while True:
+        try:
+            yield pickle.load(f)
+        except EOFError:
+            return
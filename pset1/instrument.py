@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+
+# Wall-clock timing of the simulator's phases and of the agents' calls.
+
+from timeit import default_timer as clock
+
+
+class Timings:
+    """
+    Accumulated seconds, by phase and by (agent class, method).
+
+        t = timings.start()
+        ... work ...
+        timings.stop("requests", t)
+    """
+    def __init__(self):
+        self.phases = dict()   # phase -> seconds
+        self.agents = dict()   # (class name, method) -> [seconds, calls]
+
+    def start(self):
+        return clock()
+
+    def stop(self, phase, started):
+        self.phases[phase] = self.phases.get(phase, 0.0) + (clock() - started)
+
+    def stop_agent(self, peer, method, started):
+        key = (peer.__class__.__name__, method)
+        entry = self.agents.setdefault(key, [0.0, 0])
+        entry[0] += clock() - started
+        entry[1] += 1
+
+    def merge(self, other):
+        """Add other's totals (e.g. from another iteration) into these"""
+        for (phase, seconds) in other.phases.items():
+            self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+        for (key, (seconds, calls)) in other.agents.items():
+            entry = self.agents.setdefault(key, [0.0, 0])
+            entry[0] += seconds
+            entry[1] += calls
+
+    def report(self):
+        total = sum(self.phases.values())
+        lines = ["Phase: seconds (share)"]
+        for phase in sorted(self.phases, key=self.phases.get, reverse=True):
+            seconds = self.phases[phase]
+            share = 100.0 * seconds / total if total > 0 else 0.0
+            lines.append("%s: %.3f  (%.1f%%)" % (phase, seconds, share))
+        lines.append("Agent calls: seconds (calls)")
+        for key in sorted(self.agents, key=lambda k: self.agents[k][0],
+                          reverse=True):
+            (seconds, calls) = self.agents[key]
+            lines.append("%s.%s: %.3f  (%d)" % (key[0], key[1], seconds, calls))
+        return "\n".join(lines)
+
+
+class NullTimings(Timings):
+    """Stands in for Timings when timing is off; records nothing"""
+    def start(self):
+        return 0
+
+    def stop(self, phase, started):
+        pass
+
+    def stop_agent(self, peer, method, started):
+        pass
+
+
+def make_timings(enabled):
+    if enabled:
+        return Timings()
+    return NullTimings()
@@ -1,6 +1,14 @@
-#!/usr/bin/python
+#!/usr/bin/env python3
+
+import itertools
+
+# The sim creates thousands of these every round, so they use __slots__:
+# no per-instance __dict__, smaller objects and faster construction.
+# That also means agents can't hang extra attributes off them.
+
+class Upload(object):
+    __slots__ = ('from_id', 'to_id', 'bw')
 
-class Upload:
     def __init__(self, from_id, to_id, up_bw):
         self.from_id = from_id
         self.to_id = to_id
@@ -10,7 +18,9 @@ class Upload:
         return "Upload(from_id = %s, to_id=%s, bw=%d)" % (
             self.from_id, self.to_id, self.bw)
 
-class Request:
+class Request(object):
+    __slots__ = ('requester_id', 'peer_id', 'piece_id', 'start')
+
     def __init__(self, requester_id, peer_id, piece_id, start):
         self.requester_id = requester_id
         self.peer_id = peer_id   # peer data is requested from
@@ -21,10 +31,12 @@ class Request:
         return "Request(requester_id=%s, peer_id=%s, piece_id=%d, start=%d)" % (
             self.requester_id, self.peer_id, self.piece_id, self.start)
 
-class Download:
+class Download(object):
     """ Not actually a message--just used for accounting and history tracking of
      what is actually downloaded.
     """
+    __slots__ = ('from_id', 'to_id', 'piece', 'blocks')
+
     def __init__(self, from_id, to_id, piece, blocks):
         self.from_id = from_id  # who did the agent download from?
         self.to_id = to_id      # Who downloaded?
@@ -38,11 +50,13 @@ class Download:
 
 
             
-class PeerInfo:
+class PeerInfo(object):
     """
     Only passing peer ids and the pieces they have available to each agent.
     This prevents them from accidentally messing up the state of other agents.
     """
+    __slots__ = ('id', 'available_pieces')
+
     def __init__(self, id, available):
         self.id = id
         self.available_pieces = available
@@ -50,3 +64,43 @@ class PeerInfo:
     def __repr__(self):
         return "PeerInfo(id=%s)" % self.id
 
+
+class OtherPeers(object):
+    """
+    What an agent gets as its peers argument: a read-only sequence of the
+    PeerInfo for every peer but itself.
+
+    Wraps the round's tuple of PeerInfo, shared by all the agents, and skips
+    the caller's entry while iterating instead of copying the rest.  Use
+    sorted(peers) or list(peers) for a list of your own.
+    """
+    __slots__ = ('peer_info', 'skip')
+
+    def __init__(self, peer_info, skip):
+        """peer_info: tuple of PeerInfo; skip: index of the caller's"""
+        self.peer_info = peer_info
+        self.skip = skip
+
+    def __len__(self):
+        return len(self.peer_info) - 1
+
+    def __iter__(self):
+        return itertools.chain(
+            itertools.islice(self.peer_info, 0, self.skip),
+            itertools.islice(self.peer_info, self.skip + 1, None))
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return list(self)[i]
+        n = len(self)
+        if i < 0:
+            i += n
+        if not 0 <= i < n:
+            raise IndexError("OtherPeers index out of range")
+        if i >= self.skip:
+            i += 1
+        return self.peer_info[i]
+
+    def __repr__(self):
+        return repr(list(self))
+
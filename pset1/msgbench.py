@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+
+"""
+Micro-benchmark for the message classes in messages.py.
+
+Compares them with the old __dict__-based definitions: bytes per instance
+and constructions per second for Upload, Request and Download.
+
+    python msgbench.py [--number N]
+"""
+
+import sys
+import timeit
+from optparse import OptionParser
+
+import messages
+
+
+# The definitions messages.py used before it switched to __slots__
+class DictUpload:
+    def __init__(self, from_id, to_id, up_bw):
+        self.from_id = from_id
+        self.to_id = to_id
+        self.bw = up_bw
+
+class DictRequest:
+    def __init__(self, requester_id, peer_id, piece_id, start):
+        self.requester_id = requester_id
+        self.peer_id = peer_id
+        self.piece_id = piece_id
+        self.start = start
+
+class DictDownload:
+    def __init__(self, from_id, to_id, piece, blocks):
+        self.from_id = from_id
+        self.to_id = to_id
+        self.piece = piece
+        self.blocks = blocks
+
+
+CASES = [
+    ("Upload", DictUpload, messages.Upload, ("Peer1", "Peer2", 5)),
+    ("Request", DictRequest, messages.Request, ("Peer1", "Peer2", 17, 2)),
+    ("Download", DictDownload, messages.Download, ("Peer1", "Peer2", 17, 2)),
+]
+
+
+def instance_bytes(obj):
+    """Size of the instance itself plus its __dict__, if it has one"""
+    size = sys.getsizeof(obj)
+    if hasattr(obj, "__dict__"):
+        size += sys.getsizeof(obj.__dict__)
+    return size
+
+
+def constructions_per_sec(cls, args, number):
+    seconds = min(timeit.repeat(lambda: cls(*args), number=number, repeat=3))
+    return number / seconds
+
+
+def main(args):
+    parser = OptionParser(usage="Usage: %prog [--number N]")
+    parser.add_option("--number",
+                      dest="number", default=200000, type="int",
+                      help="Constructions per timing run")
+    (options, args) = parser.parse_args(args[1:])
+
+    print("%-10s %18s %18s %26s %26s" % (
+        "message", "bytes (before)", "bytes (after)",
+        "constructions/s (before)", "constructions/s (after)"))
+    for (name, old_cls, new_cls, params) in CASES:
+        print("%-10s %18d %18d %26.0f %26.0f" % (
+            name,
+            instance_bytes(old_cls(*params)),
+            instance_bytes(new_cls(*params)),
+            constructions_per_sec(old_cls, params, options.number),
+            constructions_per_sec(new_cls, params, options.number)))
+
+
+if __name__ == "__main__":
+    main(sys.argv)
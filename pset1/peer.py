@@ -1,20 +1,32 @@
-#!/usr/bin/python
+#!/usr/bin/env python3
 
 import random
 from messages import Upload, Request
-from util import even_split
+from util import even_split, derive_seed
+from bitset import Bitset
 
 class Peer:
-    def __init__(self, config, id, init_pieces, up_bandwidth):
+    def __init__(self, config, id, init_pieces, up_bandwidth, seed=None):
         self.conf = config
         self.id = id
-        self.pieces = init_pieces[:]
+        # The sim hands each peer its own list
+        self.pieces = init_pieces
+        # Bitset of the pieces we have every block of
+        self.available = Bitset.from_ids(
+            i for (i, blocks) in enumerate(init_pieces)
+            if blocks == config.blocks_per_piece)
         # bandwidth measured in blocks-per-time-period
         self.up_bw = up_bandwidth
 
+        # Use these instead of the random module (or np.random) so that
+        # this peer's choices only depend on its seed.
+        self.seed = seed
+        self.rng = random.Random(seed)
+        self._numpy_rng = None
+
         # This is an upper bound on the number of requests to send to
         # each peer -- they can't possibly handle more than this in one round
-        self.max_requests = self.conf.max_up_bw / self.conf.blocks_per_piece + 1
+        self.max_requests = self.conf.max_up_bw // self.conf.blocks_per_piece + 1
         self.max_requests = min(self.max_requests, self.conf.num_pieces)
 
         self.post_init()
@@ -24,12 +36,31 @@ class Peer:
             self.__class__.__name__,
             self.id, self.pieces, self.up_bw)
 
-    def update_pieces(self, new_pieces):
+    def numpy_rng(self):
+        """This peer's numpy RandomState, made on first use so peers that
+        don't need numpy don't import it."""
+        if self._numpy_rng is None:
+            import numpy as np
+            if self.seed is None:
+                self._numpy_rng = np.random.RandomState()
+            else:
+                self._numpy_rng = np.random.RandomState(
+                    derive_seed(self.seed, "numpy"))
+        return self._numpy_rng
+
+    def update_pieces(self, new_pieces, available=None):
         """
         Called by the sim when this peer gets new pieces.  Using a function
         so it's easy to add any extra processing...
+
+        available: Bitset of the completed pieces, if the caller has it
         """
         self.pieces = new_pieces
+        if available is None:
+            available = Bitset.from_ids(
+                i for (i, blocks) in enumerate(new_pieces)
+                if blocks == self.conf.blocks_per_piece)
+        self.available = available
 
     def requests(self, peers, history):
         return []
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+
+# Peer ids interned to dense numbers, so the simulator can keep its per-peer
+# state in lists indexed by number instead of dicts keyed by name.
+
+
+class PeerId(str):
+    """
+    A peer's id.  It is the peer's name ("Seed0", "RSCTorrentStd3"), so
+    agents can print, compare, sort and hash it like any string, and it
+    carries num, the peer's position in the sim's list of peers.
+
+    The Requests and Uploads agents build from the ids they're handed
+    (self.id, PeerInfo.id, Request.requester_id) carry the PeerId along,
+    and so do the Downloads in the history.
+    """
+    def __new__(cls, name, num):
+        self = str.__new__(cls, name)
+        self.num = num
+        return self
+
+    def __getnewargs__(self):
+        # For pickle: worker processes and --history-spill
+        return (str(self), self.num)
+
+
+class PeerTable:
+    """
+    The interning table: one PeerId per peer, numbered 0, 1, ... in order.
+
+    table[num] is the PeerId numbered num.  table.num(peer_id) and
+    table.get(peer_id) take a PeerId or a plain name, since an agent may
+    build its own ids.
+    """
+    def __init__(self, names):
+        self.ids = [PeerId(name, num) for (num, name) in enumerate(names)]
+        # PeerIds hash and compare like their names, so this finds either
+        self.by_name = dict((pid, pid) for pid in self.ids)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __iter__(self):
+        return iter(self.ids)
+
+    def __getitem__(self, num):
+        return self.ids[num]
+
+    def __contains__(self, peer_id):
+        return peer_id in self.by_name
+
+    def get(self, peer_id):
+        """The PeerId for peer_id, or None if there is no such peer"""
+        return self.by_name.get(peer_id)
+
+    def num(self, peer_id):
+        """peer_id's number; KeyError if there is no such peer"""
+        return self.by_name[peer_id].num
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+
+from bitset import Bitset
+
+class PieceState:
+    """
+    The simulator's record of how many blocks of each piece every peer has.
+
+    blocks: [blocks of piece 0, blocks of piece 1, ...] for each peer
+    available: Bitset of the ids of completed pieces, for each peer
+    remaining: number of peers that don't have every piece yet
+    piece_counts: how many peers have each piece available
+
+    Agents never see these structures directly--they get a read-only view
+    of their own row via pieces(), and the available Bitsets through PeerInfo.
+
+    The per-peer lists are indexed by PeerId.num, e.g. available[peer_id.num].
+    """
+    def __init__(self, conf, peer_ids, init_pieces):
+        """
+        peer_ids: the PeerTable's ids, in number order
+        init_pieces: list of blocks per piece, for each of peer_ids
+        """
+        self.conf = conf
+        self.peer_ids = peer_ids[:]
+        self.blocks = [pieces[:] for pieces in init_pieces]
+        # tuple(blocks[num]), until it changes
+        self.views = [None] * len(peer_ids)
+        self.init_available()
+
+    def init_available(self):
+        """Set up the available Bitsets and the completion counters"""
+        self.available = [Bitset.from_ids(self.completed_pieces(pid))
+                          for pid in self.peer_ids]
+        # Peers that finished since the last pop_newly_done()
+        self.newly_done = [pid for pid in self.peer_ids if self.is_done(pid)]
+        self.remaining = len(self.peer_ids) - len(self.newly_done)
+        self.piece_counts = self.count_pieces()
+
+    def count_pieces(self):
+        counts = [0] * self.conf.num_pieces
+        for have in self.available:
+            for piece_id in have:
+                counts[piece_id] += 1
+        return counts
+
+    def rarity(self):
+        """A read-only snapshot of piece_counts to hand to the agents"""
+        return tuple(self.piece_counts)
+
+    def finish_piece(self, peer_id, piece_id):
+        """Record that peer_id now has every block of piece_id"""
+        # Bitsets are immutable: PeerInfo from earlier rounds keeps its own
+        num = peer_id.num
+        have = self.available[num] = self.available[num].with_id(piece_id)
+        self.piece_counts[piece_id] += 1
+        if len(have) == self.conf.num_pieces:
+            self.newly_done.append(peer_id)
+            self.remaining -= 1
+
+    def completed_pieces(self, peer_id):
+        """Return a list of the piece ids this peer has all the blocks of"""
+        full = self.conf.blocks_per_piece
+        row = self.blocks[peer_id.num]
+        return [i for i in range(self.conf.num_pieces) if row[i] == full]
+
+    def pieces(self, peer_id):
+        """Return a read-only sequence of blocks per piece for this peer.
+        The tuple is only rebuilt after the peer gets new blocks, so peers
+        that are done or idle cost nothing."""
+        num = peer_id.num
+        view = self.views[num]
+        if view is None:
+            view = self.views[num] = tuple(self.blocks[num])
+        return view
+
+    def blocks_of(self, peer_id, piece_id):
+        return self.blocks[peer_id.num][piece_id]
+
+    def add_blocks(self, gains):
+        """
+        gains: list of (peer_id, piece_id, blocks) -- the blocks each peer
+        received this round.  Each (peer_id, piece_id) appears at most once.
+
+        Updates the block counts in place and moves finished pieces into
+        the available Bitsets.
+        """
+        full = self.conf.blocks_per_piece
+        for (peer_id, piece_id, blocks) in gains:
+            row = self.blocks[peer_id.num]
+            row[piece_id] += blocks
+            self.views[peer_id.num] = None
+            if row[piece_id] == full:
+                self.finish_piece(peer_id, piece_id)
+
+    def is_done(self, peer_id):
+        return len(self.available[peer_id.num]) == self.conf.num_pieces
+
+    def pop_newly_done(self):
+        """Return the peers that finished since the last call, and forget them"""
+        done = self.newly_done
+        self.newly_done = []
+        return done
+
+    def scan_done_peers(self):
+        """Return the ids of the peers that have every block of every piece,
+        found the slow way.  Used to cross-check the counters."""
+        full = self.conf.blocks_per_piece
+        return [pid for pid in self.peer_ids
+                if min(self.blocks[pid.num]) >= full]
+
+    def check_done(self):
+        """Raise an AssertionError if the counters disagree with a full scan"""
+        scanned = set(self.scan_done_peers())
+        counted = set(pid for pid in self.peer_ids if self.is_done(pid))
+        assert scanned == counted, (
+            "Completion counters out of sync: scan says %s, counters say %s"
+            % (sorted(scanned), sorted(counted)))
+        assert self.remaining == len(self.peer_ids) - len(counted), (
+            "Remaining peer count %d out of sync" % self.remaining)
+        assert list(self.piece_counts) == list(self.count_pieces()), (
+            "Piece counts out of sync")
+
+
+def make_piece_state(conf, peer_ids, init_pieces):
+    """Build the piece state for the engine selected by conf.engine"""
+    if conf.engine == "numpy":
+        # Only pay for the numpy import when it's asked for
+        from arraystate import ArrayPieceState
+        return ArrayPieceState(conf, peer_ids, init_pieces)
+    elif conf.engine == "python":
+        return PieceState(conf, peer_ids, init_pieces)
+    raise ValueError("Unknown engine: %s" % conf.engine)
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+
+# Rarest-first request planning, shared by the RSCTorrent agents.
+#
+# numpy is imported inside the functions, so loading an agent module stays
+# cheap until the agent first plans requests.
+
+from messages import Request
+from bitset import Bitset
+
+
+def availability_mask(available_pieces, num_pieces):
+    """Boolean array with True at each piece id in available_pieces
+    (a Bitset, or any iterable of piece ids)"""
+    if isinstance(available_pieces, Bitset):
+        return available_pieces.to_mask(num_pieces)
+    import numpy as np
+    mask = np.zeros(num_pieces, dtype=bool)
+    mask[list(available_pieces)] = True
+    return mask
+
+
+def rarest_first_order(pieces, blocks_per_piece, peers, piece_counts=None,
+                       rng=None):
+    """
+    Return an array of the piece ids this peer still needs, rarest first.
+    Pieces held by the same number of peers come out in random order.
+
+    pieces: blocks per piece for the requesting peer
+    peers: PeerInfo for everyone else
+    piece_counts: swarm-wide counts (AgentHistory.piece_counts), including
+        the requesting peer.  If None, they are counted from peers.
+    rng: numpy RandomState used to break ties (default: np.random)
+    """
+    import numpy as np
+    if rng is None:
+        rng = np.random
+    pieces = np.asarray(pieces)
+    num_pieces = len(pieces)
+    have = pieces >= blocks_per_piece
+
+    if piece_counts is None:
+        counts = np.zeros(num_pieces, dtype=int)
+        for peer in peers:
+            counts += availability_mask(peer.available_pieces, num_pieces)
+    else:
+        # Don't count ourselves
+        counts = np.asarray(piece_counts) - have
+
+    needed = np.flatnonzero(~have)
+    if len(needed) == 0:
+        return needed
+    tie_break = rng.random_sample(len(needed))
+    return needed[np.lexsort((tie_break, counts[needed]))]
+
+
+def rarest_first_requests(requester_id, pieces, blocks_per_piece, peers,
+                          max_requests, piece_counts=None, unique=False,
+                          rng=None, available=None):
+    """
+    Plan this round's requests: ask each peer for up to max_requests of the
+    pieces we need that it has, rarest first.
+
+    unique: if True, never ask two peers for the same piece in one round.
+    available: the requester's Bitset of completed pieces (Peer.available).
+        If given, peers with nothing we need are skipped with one bitwise op.
+
+    Returns a list of Request objects.
+    """
+    import numpy as np
+    order = rarest_first_order(pieces, blocks_per_piece, peers, piece_counts,
+                               rng)
+    requests = []
+    if len(order) == 0:
+        return requests
+
+    num_pieces = len(pieces)
+    max_per_peer = min(max_requests, len(order))
+    taken = np.zeros(num_pieces, dtype=bool)
+    for peer in peers:
+        if available is not None:
+            useful = peer.available_pieces - available
+            if not useful:
+                continue
+            wanted = useful.to_mask(num_pieces)
+        else:
+            wanted = availability_mask(peer.available_pieces, num_pieces)
+        if unique:
+            wanted &= ~taken
+        chosen = order[wanted[order]][:max_per_peer]
+        if unique:
+            taken[chosen] = True
+        for piece_id in chosen.tolist():
+            # must get the next-needed blocks in order
+            requests.append(Request(requester_id, peer.id, piece_id,
+                                    pieces[piece_id]))
+    return requests
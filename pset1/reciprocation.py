@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+
+# Reciprocation primitives shared by the RSCTorrent agents' uploads():
+# who gave us the most, and how to split bandwidth among them.
+#
+# They work on the dicts AgentHistory.received_from() returns, so an agent
+# doesn't need to build a DataFrame every round.  numpy is only imported
+# once an agent actually splits bandwidth.
+
+import math
+
+
+def contributors(received, peer_ids, candidates):
+    """
+    The peers in candidates that sent us blocks, in peer_ids order.
+
+    received: dict : peer_id -> blocks (e.g. history.received_from(n_rounds))
+    peer_ids: every other peer's id, e.g. [peer.id for peer in peers]
+    candidates: the peers that may be picked, e.g. this round's requesters
+    """
+    wanted = set(candidates)
+    return [p for p in peer_ids if p in wanted and received.get(p, 0) > 0]
+
+
+def top_contributors(received, peer_ids, candidates, k):
+    """
+    The (up to) k peers in candidates that sent us the most blocks, most
+    first.  Ties keep their peer_ids order.
+    """
+    givers = contributors(received, peer_ids, candidates)
+    # sort is stable, with reverse=True too
+    givers.sort(key=received.get, reverse=True)
+    return givers[:k]
+
+
+def proportional_split(received, givers, bw, optimistic_share):
+    """
+    Split (1 - optimistic_share) of bw among givers in proportion to the
+    blocks each sent us, rounding each share to whole blocks (halves to
+    even).  The rest is left for an optimistic unchoke.
+
+    Returns (shares, optimistic_bw): shares[i] is for givers[i].
+    optimistic_bw is whatever the rounded shares leave of bw, or
+    bw * optimistic_share rounded halves up, as a float, if no shares were
+    given out (the Python 2 round() the agents were written against).
+    """
+    import numpy as np
+    amounts = np.array([received[p] for p in givers], dtype=float)
+    shares = (amounts / amounts.sum() * (bw * (1 - optimistic_share))).round()
+    total = float(shares.sum())
+    if total > 0:
+        optimistic_bw = bw - total
+    else:
+        # Python 3's round() would send halves to even: 0 for a bw of 5
+        optimistic_bw = float(math.floor(bw * optimistic_share + 0.5))
+    return shares.tolist(), optimistic_bw
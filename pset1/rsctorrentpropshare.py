@@ -1,4 +1,4 @@
-#!/usr/bin/python
+#!/usr/bin/env python3
 
 # This is a dummy peer that just illustrates the available information your peers 
 # have available.
@@ -6,19 +6,18 @@
 # You'll want to copy this file to AgentNameXXX.py for various versions of XXX,
 # probably get rid of the silly logging messages, and then add more logic.
 
-import random
 import logging
 import math
-import numpy as np 
-import pandas as pd
 
-from messages import Upload, Request
-from util import even_split
+from messages import Upload
+from util import even_split, log_enabled, unique
 from peer import Peer
+from planner import rarest_first_requests
+from reciprocation import contributors, proportional_split
 
 class RSCTorrentPropShare(Peer):
     def post_init(self):
-        print "post_init(): %s here!" % self.id
+        logging.debug("post_init(): %s here!", self.id)
 
         self.state = dict()
         self.state["round"] = 0
@@ -34,51 +33,29 @@ class RSCTorrentPropShare(Peer):
         This will be called after update_pieces() with the most recent state.
         """
 
-        needed = lambda i: self.pieces[i] < self.conf.blocks_per_piece
-        needed_pieces = filter(needed, range(len(self.pieces)))
-        np_set = set(needed_pieces)
+        if log_enabled(logging.DEBUG):
+            needed = lambda i: self.pieces[i] < self.conf.blocks_per_piece
+            needed_pieces = list(filter(needed, range(len(self.pieces))))
 
-        logging.debug("%s here: still need pieces %s" % (
-            self.id, needed_pieces))
+            logging.debug("%s here: still need pieces %s",
+                          self.id, needed_pieces)
 
-        logging.debug("%s still here. Here are some peers:" % self.id)
-        for p in peers:
-            logging.debug("id: %s, available pieces: %s" % (p.id, p.available_pieces))
+            logging.debug("%s still here. Here are some peers:", self.id)
+            for p in peers:
+                logging.debug("id: %s, available pieces: %s", p.id, p.available_pieces)
 
-        logging.debug("And look, I have my entire history available too:")
-        logging.debug("look at the AgentHistory class in history.py for details")
-        logging.debug(str(history))
+            logging.debug("And look, I have my entire history available too:")
+            logging.debug("look at the AgentHistory class in history.py for details")
+            logging.debug("%s", history)
 
-        requests = [] 
-
-        # COMPUTE RARITY - number of instances of a given piece
-        counts = pd.DataFrame(data=np.zeros(len(self.pieces)))
-        for peer in peers:  
-            for piece_index in set(peer.available_pieces):
-                counts.iloc[piece_index, 0] = counts.iloc[piece_index, 0] + 1
-
-        # RAREST FIRST - request the pieces held by the fewest people
-        # shuffle counts to break symmetry, then sort
-        counts = counts.sample(frac=1)
-        sorted_counts = counts.sort_values(0)
-
-        # filter to only request elements we need
-        filtered_sorted_counts = sorted_counts[sorted_counts.index.isin(np_set)]
-        max_pieces_to_download = min(self.max_requests, filtered_sorted_counts.size)
-
-        # iterate peers, requesting pieces in order of rarity
-        for peer in peers:
-            pieces_downloaded_from_peer = 0
-            for piece_id in filtered_sorted_counts.index.values:
-                if piece_id in peer.available_pieces:     
-                    start_block = self.pieces[piece_id]
-                    r = Request(self.id, peer.id, piece_id, start_block)
-                    requests.append(r)
-
-                    # check that we do not exceed maximum possible downloads
-                    pieces_downloaded_from_peer = pieces_downloaded_from_peer + 1
-                    if pieces_downloaded_from_peer == max_pieces_to_download:
-                        break
+        # RAREST FIRST - request the pieces held by the fewest people, up to
+        # max_requests from each peer (ties broken at random)
+        requests = rarest_first_requests(self.id, self.pieces,
+                                         self.conf.blocks_per_piece, peers,
+                                         self.max_requests,
+                                         piece_counts=history.piece_counts,
+                                         rng=self.numpy_rng(),
+                                         available=self.available)
 
         return requests
 
@@ -94,8 +71,7 @@ class RSCTorrentPropShare(Peer):
         """
 
         current_round = history.current_round()
-        logging.debug("%s again.  It's round %d." % (
-            self.id, current_round))
+        logging.debug("%s again.  It's round %d.", self.id, current_round)
 
         if len(requests) == 0:
             logging.debug("No one wants my pieces!")
@@ -105,42 +81,31 @@ class RSCTorrentPropShare(Peer):
             logging.debug("Still here: uploading to a random peer")
 
             n_rounds = 2
-            prev_rounds = history.downloads[-n_rounds:]
-            peer_blocks_downloaded = pd.DataFrame(data=np.zeros(len(peers)), index=[peer.id for peer in peers])
-            for prev_round in prev_rounds:
-                for download in prev_round:
-                    peer_blocks_downloaded.loc[download.from_id] = peer_blocks_downloaded.loc[download.from_id] + download.blocks
-
-
-            peers_with_pos_upload = peer_blocks_downloaded[peer_blocks_downloaded[0] > 0].index.values
+            received = history.received_from(n_rounds)
             requesters = [request.requester_id for request in requests]
 
-            requesters_with_pos_upload = [peer for peer in peers_with_pos_upload if peer in requesters]
-            filtered_peer_blocks_downloaded = peer_blocks_downloaded[peer_blocks_downloaded.index.isin(requesters_with_pos_upload)]        
-            filtered_peer_blocks_downloaded_percentage = filtered_peer_blocks_downloaded / filtered_peer_blocks_downloaded.sum()
+            requesters_with_pos_upload = contributors(received, [peer.id for peer in peers],
+                                                      requesters)
 
             # assign some bw to prop sharing, assign some bw to optimisitic unchoking
+            # (only what the rounded shares leave goes to optimistic unchoking)
             optimistic_bw_percentage = .1
-            propshare_bw  = self.up_bw * (1-optimistic_bw_percentage)
-            propshare_peer_bw = (filtered_peer_blocks_downloaded_percentage * propshare_bw).round()
-            rounded_propshare_bw = propshare_peer_bw.sum().values[0]
-
-            # only assign some BW to optimistic unchoking
-            optimistic_bw = self.up_bw - rounded_propshare_bw if rounded_propshare_bw > 0 else round(self.up_bw * optimistic_bw_percentage)
+            propshare_peer_bw, optimistic_bw = proportional_split(
+                received, requesters_with_pos_upload, self.up_bw, optimistic_bw_percentage)
 
             # filtered candidates for optimistic unchocking
-            other_requesters = list(set([requester for requester in requesters if requester not in requesters_with_pos_upload]))
+            other_requesters = unique([requester for requester in requesters if requester not in requesters_with_pos_upload])
 
             # OPTIMISTIC UNCHOKING: unchoke randomly every 3 stages
             optimistic_rounds = 3
             if len(other_requesters) > 0:
                 if self.state["optimistic_spot"] is not None:
                     if self.state["round"] % optimistic_rounds == 0 or self.state["optimistic_spot"] in requesters_with_pos_upload:            
-                        optimistic_spot = [random.choice(other_requesters)]
+                        optimistic_spot = [self.rng.choice(other_requesters)]
                     else:
                         optimistic_spot = [self.state["optimistic_spot"]]
                 else:
-                    optimistic_spot = [random.choice(other_requesters)]
+                    optimistic_spot = [self.rng.choice(other_requesters)]
 
                 self.state["optimistic_spot"] = optimistic_spot[0]
 
@@ -153,7 +118,7 @@ class RSCTorrentPropShare(Peer):
 
             # Evenly "split" my upload bandwidth among the one chosen requester
             if(len(chosen) > 0):
-                bws = list(propshare_peer_bw.values.T[0]) + [optimistic_bw]
+                bws = propshare_peer_bw + [optimistic_bw]
             else:
                 bws = []
 
@@ -1,4 +1,4 @@
-#!/usr/bin/python
+#!/usr/bin/env python3
 
 # This is a dummy peer that just illustrates the available information your peers 
 # have available.
@@ -6,18 +6,17 @@
 # You'll want to copy this file to AgentNameXXX.py for various versions of XXX,
 # probably get rid of the silly logging messages, and then add more logic.
 
-import random
 import logging
-import numpy as np 
-import pandas as pd
 
-from messages import Upload, Request
-from util import even_split
+from messages import Upload
+from util import even_split, log_enabled
 from peer import Peer
+from planner import rarest_first_requests
+from reciprocation import top_contributors
 
 class RSCTorrentStd(Peer):
     def post_init(self):
-        print "post_init(): %s here!" % self.id
+        logging.debug("post_init(): %s here!", self.id)
         self.state = dict()
         self.state["round"] = 0
         self.state["optimistic_spot"] = None
@@ -31,52 +30,29 @@ class RSCTorrentStd(Peer):
 
         This will be called after update_pieces() with the most recent state.
         """
-        needed = lambda i: self.pieces[i] < self.conf.blocks_per_piece
-        needed_pieces = filter(needed, range(len(self.pieces)))
-
-        np_set = set(needed_pieces)
-
-        logging.debug("%s here: still need pieces %s" % (
-            self.id, needed_pieces))
-
-        logging.debug("%s still here. Here are some peers:" % self.id)
-        for p in peers:
-            logging.debug("id: %s, available pieces: %s" % (p.id, p.available_pieces))
-
-        logging.debug("And look, I have my entire history available too:")
-        logging.debug("look at the AgentHistory class in history.py for details")
-        logging.debug(str(history))
-
-        requests = [] 
-
-        # COMPUTE RARITY - number of instances of a given piece
-        counts = pd.DataFrame(data=np.zeros(len(self.pieces)))
-        for peer in peers:  
-            for piece_index in set(peer.available_pieces):
-                counts.iloc[piece_index, 0] = counts.iloc[piece_index, 0] + 1
-
-        # RAREST FIRST - request the pieces held by the fewest people
-        # shuffle counts to break symmetry, then sort
-        counts = counts.sample(frac=1)
-        sorted_counts = counts.sort_values(0)
-
-        # filter to only request elements we need
-        filtered_sorted_counts = sorted_counts[sorted_counts.index.isin(np_set)]
-        max_pieces_to_download = min(self.max_requests, filtered_sorted_counts.size)
-
-        # iterate peers, requesting pieces in order of rarity
-        for peer in peers:
-            pieces_downloaded_from_peer = 0
-            for piece_id in filtered_sorted_counts.index.values:
-                if piece_id in peer.available_pieces:     
-                    start_block = self.pieces[piece_id]
-                    r = Request(self.id, peer.id, piece_id, start_block)
-                    requests.append(r)
-
-                    # check that we do not exceed maximum possible downloads
-                    pieces_downloaded_from_peer = pieces_downloaded_from_peer + 1
-                    if pieces_downloaded_from_peer == max_pieces_to_download:
-                        break
+        if log_enabled(logging.DEBUG):
+            needed = lambda i: self.pieces[i] < self.conf.blocks_per_piece
+            needed_pieces = list(filter(needed, range(len(self.pieces))))
+
+            logging.debug("%s here: still need pieces %s",
+                          self.id, needed_pieces)
+
+            logging.debug("%s still here. Here are some peers:", self.id)
+            for p in peers:
+                logging.debug("id: %s, available pieces: %s", p.id, p.available_pieces)
+
+            logging.debug("And look, I have my entire history available too:")
+            logging.debug("look at the AgentHistory class in history.py for details")
+            logging.debug("%s", history)
+
+        # RAREST FIRST - request the pieces held by the fewest people, up to
+        # max_requests from each peer (ties broken at random)
+        requests = rarest_first_requests(self.id, self.pieces,
+                                         self.conf.blocks_per_piece, peers,
+                                         self.max_requests,
+                                         piece_counts=history.piece_counts,
+                                         rng=self.numpy_rng(),
+                                         available=self.available)
 
         return requests
 
@@ -92,8 +68,7 @@ class RSCTorrentStd(Peer):
         """
 
         round = history.current_round()
-        logging.debug("%s again.  It's round %d." % (
-            self.id, round))
+        logging.debug("%s again.  It's round %d.", self.id, round)
 
         if len(requests) == 0:
             logging.debug("No one wants my pieces!")
@@ -104,20 +79,13 @@ class RSCTorrentStd(Peer):
 
             # HISTORY: compute who has cooperated the last n rounds
             n_rounds = 2
-            prev_rounds_downloads = history.downloads[-n_rounds:]
-            peer_blocks_downloaded = pd.DataFrame(data=np.zeros(len(peers)), index=[peer.id for peer in peers])
-            for prev_round_downloads in prev_rounds_downloads:
-                for download in prev_round_downloads:
-                    peer_blocks_downloaded.loc[download.from_id] = peer_blocks_downloaded.loc[download.from_id] + download.blocks
-
-            # RECIPROCATION: compute top 3 uploaders who also requested
-            sorted_peers = peer_blocks_downloaded.sort_values(0, ascending=False)
-            sorted_peers_with_pos_upload = sorted_peers[sorted_peers[0] > 0].index.values
+            received = history.received_from(n_rounds)
             requesters = [request.requester_id for request in requests]
-            sorted_requesters_with_pos_upload = set(sorted_peers_with_pos_upload).intersection(set(requesters))
 
-            # find top 3 and list of possible candidates for optimistic unchoking
-            top_3_requesters = list(sorted_requesters_with_pos_upload)[:3]
+            # RECIPROCATION: compute top 3 uploaders who also requested,
+            # and list of possible candidates for optimistic unchoking
+            top_3_requesters = top_contributors(received, [peer.id for peer in peers],
+                                                requesters, 3)
             other_requesters = [requester for requester in requesters if requester not in top_3_requesters]
 
             # OPTIMISTIC UNCHOKING: unchoke randomly every 3 stages
@@ -125,11 +93,11 @@ class RSCTorrentStd(Peer):
             if len(other_requesters) > 0:
                 if self.state["optimistic_spot"] is not None:
                     if self.state["round"] % optimistic_rounds == 0 or self.state["optimistic_spot"] in top_3_requesters:             
-                        optimistic_spot = [random.choice(other_requesters)]
+                        optimistic_spot = [self.rng.choice(other_requesters)]
                     else:
                         optimistic_spot = [self.state["optimistic_spot"]]
                 else:
-                    optimistic_spot = [random.choice(other_requesters)]
+                    optimistic_spot = [self.rng.choice(other_requesters)]
 
                 self.state["optimistic_spot"] = optimistic_spot[0]
 
@@ -1,4 +1,4 @@
-#!/usr/bin/env python
+#!/usr/bin/env python3
 
 """
 Simulates one file being shared amongst a set of peers.  The file is divided into a set of pieces, each comprised of some number of blocks.  There are two types of peers:
@@ -12,21 +12,78 @@ import re
 import random
 import sys
 import logging
-import copy
 import itertools
-import pprint
 from optparse import OptionParser
 
-from messages import Upload, Request, Download, PeerInfo
+from messages import Upload, Request, Download, PeerInfo, OtherPeers
+from peerids import PeerTable
 from util import *
 from stats import Stats
 from history import History
-    
+from piecestate import make_piece_state
+from instrument import make_timings
+from cache import make_cache
+
+
+# The rules check_requests and check_uploads enforce, in the order they're
+# checked.  An agent breaking several gets the error for the first.
+REQUEST_RULES = [
+    "List of Requests contains non-Request object.",
+    "Request asks for non-existent piece!",
+    "Request mentions non-existent peer!",
+    "Request has wrong peer id!",
+    "Request has bad start block!",
+    "Asking for piece peer does not have!",
+]
+
+UPLOAD_RULES = [
+    "List of Uploads contains non-Upload object.",
+    "Can't upload to yourself.",
+    "Upload.from != peer id.",
+    "Upload bandwidth must be non-negative!",
+]
+
+
+def make_peer_ids(agent_class_names):
+    """Number the agents of each class in order: Dummy0, Dummy1, Seed0, ..."""
+    counts = dict()
+    def index(name):
+        if name in counts:
+            a = counts[name]
+            counts[name] += 1
+        else:
+            a = 0
+            counts[name] = 1
+        return a
+
+    return ["%s%d" % (n, index(n)) for n in agent_class_names]
+
+
+def run_iteration(args):
+    """Entry point for the worker processes used by Sim.run_sim.
+    args is a (config, seed, iteration) tuple.  Returns the iteration summary."""
+    config, seed, iteration = args
+    return Sim(config).run_iteration(seed, iteration)
+
+
+def iteration_seeds(config):
+    """One seed per iteration, derived from config.seed (or a random run
+    seed if that is None)"""
+    run_seed = config.seed
+    if run_seed is None:
+        run_seed = random.SystemRandom().randrange(2**31)
+    return [derive_seed(run_seed, i) for i in range(config.iters)]
+
 
 class Sim:
     def __init__(self, config):
         self.config = config
         self.up_bws_state = dict()
+        self.timings = make_timings(config.timing)
+        # Unseeded until seed_iteration() is called
+        self.iteration_seed = None
+        self.rng = random.Random()
+        self.validation_rng = random.Random()
 
     
     def up_bw(self, peer_id, reinit=False):
@@ -40,128 +97,111 @@ class Sim:
         
         """Sets the upload bandwidth of seeds to max, other agents at random"""
         if re.match("Seed",peer_id): the_up_bw = c.max_up_bw
-        else: the_up_bw = random.randint(c.min_up_bw, c.max_up_bw)
+        else: the_up_bw = self.rng.randint(c.min_up_bw, c.max_up_bw)
         
         return s.setdefault(peer_id, the_up_bw)
 
-    def run_sim_once(self):
+    def run_sim_once(self, iteration=0):
         """Return a history"""
         conf = self.config
         # Keep track of the current round.  Needs to be in scope for helpers.
         round = 0  
 
-        def check_pred(pred, msg, Exc, lst):
-            """Check if any element of lst matches the predicate.  If it does,
-            raise an exception of type Exc, including the msg and the offending
-            element."""
-            m = map(pred, lst)
-            if True in m:
-                i = m.index(True)
-                raise Exc(msg + " Bad element: %s" % lst[i])
+        def should_check(peer):
+            """Agents listed in --trusted-agents are only validated on a
+            sample of their calls; everyone else, every call."""
+            if peer.__class__.__name__ not in conf.trusted_agents:
+                return True
+            return self.validation_rng.random() < conf.validation_sample
 
         def check_uploads(peer, uploads):
-            """Raise an IllegalUpload exception if there is a problem."""
-            def check(pred, msg):
-                check_pred(pred, msg, IllegalUpload, uploads)
-
-            not_upload = lambda o: not isinstance(o, Upload)
-            check(not_upload, "List of Uploads contains non-Upload object.")
-
-            self_upload = lambda upload: upload.to_id == peer.id
-            check(self_upload, "Can't upload to yourself.")
-            
-            not_from_self = lambda upload: upload.from_id != peer.id
-            check(not_from_self, "Upload.from != peer id.")
-
-            check(lambda u: u.bw < 0, "Upload bandwidth must be non-negative!")
+            """Raise an IllegalUpload exception if there is a problem.
+
+            One pass over uploads.  The error is the first rule in
+            UPLOAD_RULES that any upload breaks, with the first upload
+            that breaks it."""
+            worst = len(UPLOAD_RULES)
+            bad = None
+            total = 0
+            for u in uploads:
+                if not isinstance(u, Upload):
+                    rule = 0
+                elif u.to_id == peer.id:
+                    rule = 1
+                elif u.from_id != peer.id:
+                    rule = 2
+                elif u.bw < 0:
+                    rule = 3
+                else:
+                    total += u.bw
+                    continue
+                if rule < worst:
+                    worst, bad = rule, u
+                    if rule == 0:
+                        break
+            if worst < len(UPLOAD_RULES):
+                raise IllegalUpload(UPLOAD_RULES[worst] + " Bad element: %s" % bad)
 
             limit = self.up_bw(peer.id)
-            if sum(map(lambda u: u.bw, uploads)) > limit:
+            if total > limit:
                 raise IllegalUpload("Can't upload more than limit of %d. %s" % (
                     limit, uploads))
 
             # If we got here, looks ok.
 
-        def check_requests(peer, requests, peer_pieces, available):
-            """Raise an IllegalRequest exception if there is a problem."""
-
-            def check(pred, msg):
-                check_pred(pred, msg, IllegalRequest, requests)
-
-            check(lambda o: not isinstance(o, Request),
-                  "List of Requests contains non-Request object.")
+        def check_requests(peer, requests, state):
+            """Raise an IllegalRequest exception if there is a problem.
+
+            One pass over requests, reporting the same error as checking the
+            rules in REQUEST_RULES one at a time would."""
+            available = state.available
+            worst = len(REQUEST_RULES)
+            bad = None
+            for r in requests:
+                if not isinstance(r, Request):
+                    rule = 0
+                elif r.piece_id < 0 or r.piece_id >= conf.num_pieces:
+                    rule = 1
+                elif r.peer_id not in table:
+                    rule = 2
+                elif r.requester_id != peer.id:
+                    rule = 3
+                elif (r.start < 0 or r.start >= conf.blocks_per_piece or
+                      r.start > state.blocks_of(peer.id, r.piece_id)):
+                    # Must request the _next_ necessary block
+                    rule = 4
+                elif r.piece_id not in available[table.num(r.peer_id)]:
+                    rule = 5
+                else:
+                    continue
+                if rule < worst:
+                    worst, bad = rule, r
+                    if rule == 0:
+                        break
+            if worst < len(REQUEST_RULES):
+                raise IllegalRequest(REQUEST_RULES[worst] + " Bad element: %s" % bad)
 
-            bad_piece_id = lambda r: (r.piece_id < 0 or
-                                      r.piece_id >= self.config.num_pieces)
-            check(bad_piece_id, "Request asks for non-existent piece!")
-            
-            bad_peer_id = lambda r: r.peer_id not in self.peer_ids
-            check(bad_peer_id, "Request mentions non-existent peer!")
-
-            bad_requester_id = lambda r: r.requester_id != peer.id
-            check(bad_requester_id, "Request has wrong peer id!")
-
-            bad_start_block = lambda r: (
-                r.start < 0 or
-                r.start >= self.config.blocks_per_piece or
-                r.start > peer_pieces[peer.id][r.piece_id])
-            # Must request the _next_ necessary block
-            check(bad_start_block, "Request has bad start block!")
-
-            def piece_peer_does_not_have(r):
-                other_peer = self.peers_by_id[r.peer_id]
-                return r.piece_id not in available[other_peer.id]
-            check(piece_peer_does_not_have, "Asking for piece peer does not have!")
-            
             # If we got here, looks ok
 
-        def available_pieces(peer_id, peer_pieces):
-            """
-            Return a list of piece ids that this peer has available.
-            """
-            return filter(lambda i: peer_pieces[peer_id][i] == conf.blocks_per_piece,
-                          range(conf.num_pieces))
-
-        def peer_done(peer_pieces, peer_id):
-            # TODO: remove linear pass
-            for blocks_so_far in peer_pieces[peer_id]:
-                if blocks_so_far < conf.blocks_per_piece:
-                    return False
-            return True
-            
-        def all_done(peer_pieces):
-            result = True
-            # Check all peers to update done status
-            for peer_id in peer_pieces:
-                if peer_done(peer_pieces, peer_id):
-                    history.peer_is_done(round, peer_id)
-                else:
-                    result = False
-            return result
+        def all_done(state):
+            # Only the peers that finished this round need their done status
+            # updated; the state keeps the counts as pieces complete.
+            for peer_id in state.pop_newly_done():
+                history.peer_is_done(round, peer_id)
+            if log_enabled(logging.DEBUG):
+                state.check_done()
+            return state.remaining == 0
 
         def create_peers():
             """Each agent class must be already loaded, and have a
-            constructor that takes the config, id,  pieces, and
-            up and down bandwidth, in that order."""
+            constructor that takes the config, id,  pieces, 
+            up bandwidth and seed, in that order."""
 
             def load(class_name, params):
                 agent_class = conf.agent_classes[class_name]
                 return agent_class(*params)
 
-            counts = dict()
-            def index(name):
-                if name in counts:
-                    a = counts[name]
-                    counts[name] += 1
-                else:
-                    a = 0
-                    counts[name] = 1
-                return a
-
-            n = len(conf.agent_class_names)
-            ids = map(lambda n: "%s%d" % (n,index(n)), conf.agent_class_names)
-
-            is_seed = lambda id: id.startswith("Seed")
+            ids = table.ids
 
             def get_pieces(id):
                 if id.startswith("Seed"):
@@ -169,197 +209,323 @@ class Sim:
                 else:
                     return [0]*conf.num_pieces
                 
-            peer_pieces = dict()  # id -> list (blocks / piece)
-            peer_pieces = dict((id, get_pieces(id)) for id in ids)
+            peer_pieces = [get_pieces(id) for id in ids]  # blocks / piece
             pieces = [get_pieces(id) for id in ids]
             r = itertools.repeat
             
             # Re-initialize upload bandwidths at the beginning of each
             # new simulation
             up_bws = [self.up_bw(id, reinit=True) for id in ids] 
-            params = zip(r(conf), ids, pieces, up_bws)
+            if self.iteration_seed is None:
+                seeds = [None] * len(ids)
+            else:
+                seeds = [derive_seed(self.iteration_seed, id) for id in ids]
+            params = zip(r(conf), ids, pieces, up_bws, seeds)
 
-            peers = map(load, conf.agent_class_names, params)
+            peers = list(map(load, conf.agent_class_names, params))
             #logging.debug("Peers: \n" + "\n".join(str(p) for p in peers))
-            return peers, peer_pieces
-
-        def get_peer_requests(p, peer_info, peer_history, peer_pieces, available):
-            def remove_me(info):
-                # TODO: Do we need this linear pass?
-                return filter(lambda peer: peer.id != p.id, peer_info)
-
-            pieces = copy.copy(peer_pieces[p.id])
-            # Made copy of pieces and the peer info this peer needs to make it's
-            # decision, so that it can't change the simulation's copies.
-            p.update_pieces(pieces)
-            rs = p.requests(remove_me(peer_info), peer_history)
-            check_requests(p, rs, peer_pieces, available)
+            return peers, make_piece_state(conf, ids, peer_pieces)
+
+        def get_peer_requests(p, others, peer_history, state):
+            # Read-only views of this peer's pieces and of everyone else's
+            # PeerInfo, so it can't change the simulation's copies.
+            p.update_pieces(state.pieces(p.id), state.available[p.id.num])
+            started = timings.start()
+            rs = p.requests(others, peer_history)
+            timings.stop_agent(p, "requests", started)
+            if should_check(p):
+                check_requests(p, rs, state)
             return rs
 
-        def get_peer_uploads(all_requests, p, peer_info, peer_history):
-            def remove_me(info):
-                # TODO: remove this pass?  Use a set?
-                return filter(lambda peer: peer.id != p.id, peer_info)
-
-            def requests_to(id):
-                f = lambda r: r.peer_id == id
-                ans = []
-                for rs in all_requests.values():
-                    ans.extend(filter(f, rs))
-                return ans
-
-            requests = requests_to(p.id)
-
-            us = p.uploads(requests, remove_me(peer_info), peer_history)
-            check_uploads(p, us)
+        def index_requests(all_requests):
+            """
+            Return dict : peer_id -> [Requests asking that peer for data].
+            Each inbox keeps the order the requests had in all_requests.
+            (A dict: PeerIds hash like their names, so requests that name the
+            peer with a plain string land in the same inbox.)
+            """
+            inbox = dict((pid, []) for pid in table.ids)
+            for rs in all_requests:
+                for r in rs:
+                    inbox[r.peer_id].append(r)
+            return inbox
+
+        def get_peer_uploads(inbox, p, others, peer_history):
+            requests = inbox[p.id]
+            started = timings.start()
+            us = p.uploads(requests, others, peer_history)
+            timings.stop_agent(p, "uploads", started)
+            if should_check(p):
+                check_uploads(p, us)
             return us
 
-        def upload_rate(uploads, uploader_id, requester_id):
+        def index_uploads(uploads):
             """
-            return the uploading rate from uploader to requester
-            in blocks per time period, or 0 if not uploading.
+            Return, for each requester, None if nobody uploads to it, else
+            dict : uploader_id -> blocks per time period.  If an uploader
+            lists the same requester twice, the first Upload counts.
             """
-            for u in uploads[uploader_id]:
-                if u.to_id == requester_id:
-                    return u.bw
-            return 0
-
-        def update_peer_pieces(peer_pieces, requests, uploads, available):
+            rates = [None] * len(table)
+            for (uploader_id, us) in zip(table.ids, uploads):
+                for u in us:
+                    to = table.get(u.to_id)
+                    if to is None:
+                        continue
+                    given = rates[to.num]
+                    if given is None:
+                        given = rates[to.num] = dict()
+                    if uploader_id not in given:
+                        given[uploader_id] = u.bw
+            return rates
+
+        def update_peer_pieces(state, requests, uploads):
             """
             Process the uploads: figure out how many blocks of all the requested
             pieces the requesters ended up with.
             Make sure requesting the same thing from lots of peers doesn't
             stack.
-            update the sets of available pieces as needed.
+            update the available pieces as needed.
+
+            Only the requesters someone is uploading to are looked at, and
+            only the pieces they get blocks of are touched, so the cost
+            follows the number of transfers rather than peers x pieces.
             """
-            downloads = dict()  # peer_id -> [downloads]
-            new_pp = copy.deepcopy(peer_pieces)
-            for requester_id in requests:
-                downloads[requester_id] = list()
-            for requester_id in requests:
+            rates = index_uploads(uploads)
+            downloads = [[] for _ in range(len(table))]
+            gains = []  # (peer_id, piece_id, blocks), applied to state at the end
+            for (requester_id, rs, given) in zip(table.ids, requests, rates):
+                if given is None:
+                    continue
+                # Group the requests by the peer being asked, keeping only
+                # the peers that upload to this requester
+                served = dict()
+                for r in rs:
+                    if given.get(r.peer_id, 0) != 0:
+                        served.setdefault(r.peer_id, []).append(r)
+
                 # Keep track of how many blocks of each piece this
                 # requester got.  piece -> (blocks, from_who)
                 new_blocks_per_piece = dict()
-                def update_count(piece_id, blocks, peer_id):
-                    if piece_id in new_blocks_per_piece:
-                        old = new_blocks_per_piece[piece_id][0]
-                        if blocks > old:
-                            new_blocks_per_piece[piece_id] = (blocks, peer_id)
-                    else:
-                        new_blocks_per_piece[piece_id] = (blocks, peer_id)
-
-                # Group the requests by peer that is being asked
-                get_peer_id = lambda r: r.peer_id
-                rs = sorted(requests[requester_id], key=get_peer_id)
-                for peer_id, rs_for_peer in itertools.groupby(rs, get_peer_id):
-                    bw = upload_rate(uploads, peer_id, requester_id)
-                    if bw == 0:
-                        continue
+                for peer_id in sorted(served):
+                    # The interned id, whatever the agent put in the Request
+                    peer_id = table.get(peer_id)
+                    bw = given[peer_id]
                     # This bandwidth gets applied in order to each piece requested
-                    for r in rs_for_peer:
-                        needed_blocks = conf.blocks_per_piece - r.start
+                    for r in served[peer_id]:
+                        # int(): with the numpy engine, start is a numpy integer
+                        needed_blocks = conf.blocks_per_piece - int(r.start)
                         alloced_bw = min(bw, needed_blocks)
-                        update_count(r.piece_id, alloced_bw, peer_id)
+                        old = new_blocks_per_piece.get(r.piece_id)
+                        if old is None or alloced_bw > old[0]:
+                            new_blocks_per_piece[r.piece_id] = (alloced_bw, peer_id)
                         bw -= alloced_bw
                         if bw == 0:
                             break
                 for piece_id in new_blocks_per_piece:
                     (blocks, peer_id) = new_blocks_per_piece[piece_id]
-                    new_pp[requester_id][piece_id] += blocks
-                    if new_pp[requester_id][piece_id] == conf.blocks_per_piece:
-                        available[requester_id].add(piece_id)
+                    gains.append((requester_id, piece_id, blocks))
                     d = Download(peer_id, requester_id, piece_id, blocks)
-                    downloads[requester_id].append(d)
-                
-            return (new_pp, downloads)
-
-        def completed_pieces(peer_id, available):
-            return len(available[peer_id])
-        
-        def log_peer_info(peer_pieces, available):
-            for p_id in self.peer_ids:
-                pieces = peer_pieces[p_id]
-                logging.debug("pieces for %s: %s" % (str(p_id), str(pieces)))
-            log = ", ".join("%s:%s" % (p_id, completed_pieces(p_id, available))
-                            for p_id in self.peer_ids)
-            logging.info("Pieces completed: " + log)
-
+                    downloads[requester_id.num].append(d)
 
-        logging.debug("Starting simulation with config: %s" % str(conf))
+            state.add_blocks(gains)
+            return downloads
 
-        peers, peer_pieces = create_peers()
-        self.peer_ids = [p.id for p in peers]
-        self.peers_by_id = dict((p.id, p) for p in peers)
+        def completed_pieces(peer_id, state):
+            return len(state.available[peer_id.num])
+        
+        def log_peer_info(state):
+            if log_enabled(logging.DEBUG):
+                for p_id in self.peer_ids:
+                    logging.debug("pieces for %s: %s", p_id, list(state.pieces(p_id)))
+            if log_enabled(logging.INFO):
+                log = ", ".join("%s:%s" % (p_id, completed_pieces(p_id, state))
+                                for p_id in self.peer_ids)
+                logging.info("Pieces completed: %s", log)
+
+
+        logging.debug("Starting simulation with config: %s", conf)
+        timings = self.timings
+
+        # Every peer's PeerId, numbered in the order the peers are created
+        table = self.peer_table = PeerTable(
+            make_peer_ids(conf.agent_class_names))
+        peers, state = create_peers()
+        self.peer_ids = table.ids
         
         upload_rates = dict((id, self.up_bw(id)) for id in self.peer_ids)
-        history = History(self.peer_ids, upload_rates)
-
-        # dict : pid -> set(finished / available pieces)
-        available = dict((pid, set(available_pieces(pid, peer_pieces)))
-                         for pid in self.peer_ids)
-
-        # Begin the event loop
-        while True:
-            logging.info("======= Round %d ========" % round)
-
-            peer_info = [PeerInfo(p.id, available[p.id])
-                         for p in peers]
-            requests = dict()  # peer_id -> list of Requests
-            uploads = dict()   # peer_id -> list of Uploads
-            h = dict()
-            for p in peers:
-                h[p.id] = history.peer_history(p.id)
-                requests[p.id] = get_peer_requests(p, peer_info, h[p.id], peer_pieces,
-                                                   available)
-
-            for p in peers:
-                uploads[p.id] = get_peer_uploads(requests, p, peer_info, h[p.id])
-                
-
-            (peer_pieces, downloads) = update_peer_pieces(
-                peer_pieces, requests, uploads, available)
-            history.update(downloads, uploads)
-
-            logging.debug(history.pretty_for_round(round))
-
-            log_peer_info(peer_pieces, available)
+        spill = None
+        # Nothing is ever evicted without a window, so don't leave an empty
+        # file behind
+        if conf.history_spill and conf.history_window:
+            spill = open("%s.%d" % (conf.history_spill, iteration), "wb")
+        history = History(self.peer_ids, upload_rates,
+                          window=conf.history_window or None, spill=spill)
+
+        # With --scheduler active, only the peers that can act are called:
+        # requests() for the peers still missing pieces (needy, refreshed
+        # every round), uploads() for the peers someone asked for data.
+        active_only = conf.scheduler == "active"
+        needy = range(len(peers))
+
+        # Begin the event loop.  The spill file is closed however it ends
+        try:
+            while True:
+                started = timings.start()
+                logging.info("======= Round %d ========", round)
+                timings.stop("logging", started)
+
+                started = timings.start()
+                peer_info = tuple(PeerInfo(p.id, have)
+                                  for (p, have) in zip(peers, state.available))
+                # Shared by every agent this round
+                piece_counts = state.rarity()
+                if active_only:
+                    # Seeds and finished peers have nothing left to ask for
+                    requesting = needy = [i for i in needy
+                                          if not state.is_done(peers[i].id)]
+                else:
+                    requesting = range(len(peers))
+                # others[i]: everyone but peers[i], without copying peer_info;
+                # h[i]: its history.  Only made for the peers that get called.
+                others = [None] * len(peers)
+                h = [None] * len(peers)
+                # requests[i], uploads[i]: the lists of Requests and Uploads of
+                # peers[i], the peer numbered i
+                requests = [[] for _ in peers]
+                for i in requesting:
+                    others[i] = OtherPeers(peer_info, i)
+                    h[i] = history.peer_history(peers[i].id, piece_counts)
+                    requests[i] = get_peer_requests(peers[i], others[i], h[i], state)
+                timings.stop("requests", started)
+
+                started = timings.start()
+                inbox = index_requests(requests)
+                if active_only:
+                    # Only the peers someone asked for data; the seeds and
+                    # finished peers among them are called here for the first
+                    # time this round
+                    uploading = [i for (i, p) in enumerate(peers) if inbox[p.id]]
+                else:
+                    uploading = range(len(peers))
+                uploads = [[] for _ in peers]
+                for i in uploading:
+                    p = peers[i]
+                    if h[i] is None:
+                        p.update_pieces(state.pieces(p.id), state.available[i])
+                        others[i] = OtherPeers(peer_info, i)
+                        h[i] = history.peer_history(p.id, piece_counts)
+                    uploads[i] = get_peer_uploads(inbox, p, others[i], h[i])
+                timings.stop("uploads", started)
+
+                started = timings.start()
+                downloads = update_peer_pieces(state, requests, uploads)
+                timings.stop("update_peer_pieces", started)
+
+                started = timings.start()
+                history.update(downloads, uploads)
+                timings.stop("history.update", started)
+
+                started = timings.start()
+                logging.debug("%s", LazyStr(history.pretty_for_round, round))
+
+                log_peer_info(state)
+                timings.stop("logging", started)
            
-            if all_done(peer_pieces):
-                logging.info("All done!")                    
-                break
-            round += 1
-            if round > conf.max_round:
-                logging.info("Out of time.  Stopping.")
-                break
-
-        logging.info("Game history:\n%s" % history.pretty())
+                if all_done(state):
+                    logging.info("All done!")                    
+                    break
+                round += 1
+                if round > conf.max_round:
+                    logging.info("Out of time.  Stopping.")
+                    break
+        finally:
+            if spill is not None:
+                spill.close()
+
+        started = timings.start()
+        logging.info("Game history:\n%s", LazyStr(history.pretty))
 
         logging.info("======== STATS ========")
-        logging.info("Uploaded blocks:\n%s" %
-                     Stats.uploaded_blocks_str(self.peer_ids, history))
-        logging.info("Completion rounds:\n%s" %
-                     Stats.completion_rounds_str(self.peer_ids, history))
-        logging.info("All done round: %s" %
-                     Stats.all_done_round(self.peer_ids, history))
+        logging.info("Uploaded blocks:\n%s",
+                     LazyStr(Stats.uploaded_blocks_str, self.peer_ids, history))
+        logging.info("Completion rounds:\n%s",
+                     LazyStr(Stats.completion_rounds_str, self.peer_ids, history))
+        logging.info("All done round: %s",
+                     LazyStr(Stats.all_done_round, self.peer_ids, history))
+        timings.stop("logging", started)
 
         return history
 
+    def seed_iteration(self, seed):
+        """
+        Seed the random number generators for one iteration.  The sim's own
+        draws come from self.rng, and every peer gets a seed derived from
+        this one and its id.  The global random and np.random are seeded
+        too, for agents that still use them.
+        """
+        self.iteration_seed = seed
+        self.rng = random.Random(derive_seed(seed, "sim"))
+        self.validation_rng = random.Random(derive_seed(seed, "validation"))
+        random.seed(seed)
+        if "numpy" in sys.modules:
+            sys.modules["numpy"].random.seed(seed)
+
+    def run_iteration(self, seed, iteration=0):
+        """Run one seeded simulation.  Returns its summary:
+        (uploaded_blocks, completion_rounds, timings), the first two being
+        dicts keyed by peer id.
+
+        With --cache-dir and --seed, the summary comes from the result cache
+        when this config and seed have been run before."""
+        self.timings = make_timings(self.config.timing)
+        cache = None
+        if self.config.seed is not None:
+            cache = make_cache(self.config)
+        if cache is not None:
+            key = cache.key(self.config, seed)
+            hit = cache.get(key)
+            if hit is not None:
+                logging.info("Iteration %d: cached result", iteration)
+                return hit + (self.timings,)
+
+        self.seed_iteration(seed)
+        history = self.run_sim_once(iteration)
+        uploaded = Stats.uploaded_blocks(self.peer_ids, history)
+        completion = Stats.completion_rounds(self.peer_ids, history)
+        if cache is not None:
+            cache.put(key, uploaded, completion)
+        return (uploaded, completion, self.timings)
+
     def run_sim(self):
-        histories = map(lambda i: self.run_sim_once(), 
-                        range(self.config.iters))
+        conf = self.config
+        self.peer_ids = make_peer_ids(conf.agent_class_names)
+
+        # Every iteration gets its own seed, so the result is the same whether
+        # the iterations run here or spread over a pool of worker processes.
+        seeds = iteration_seeds(conf)
+
+        if conf.workers > 1:
+            import multiprocessing
+            pool = multiprocessing.Pool(conf.workers)
+            try:
+                summaries = pool.map(run_iteration,
+                                     [(conf, seed, i)
+                                      for (i, seed) in enumerate(seeds)])
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            summaries = list(map(self.run_iteration, seeds, range(conf.iters)))
+
         logging.warning("======== SUMMARY STATS ========")
         
-        uploaded_blocks = map(
-            lambda h: Stats.uploaded_blocks(self.peer_ids, h),
-            histories)
-        completion_rounds = map(
-            lambda h: Stats.completion_rounds(self.peer_ids, h),
-            histories)
+        uploaded_blocks = [u for (u, c, t) in summaries]
+        completion_rounds = [c for (u, c, t) in summaries]
 
         def extract_by_peer_id(lst, peer_id):
             """Given a list of dicts, pull out the entry
             for peer_id from each dict.  Return a list"""
-            return map(lambda d: d[peer_id], lst)
+            return [d[peer_id] for d in lst]
 
         uploaded_by_id = dict(
             (p_id, extract_by_peer_id(uploaded_blocks, p_id))
@@ -373,7 +539,7 @@ class Sim:
         for p_id in sorted(self.peer_ids,
                            key=lambda id: mean(uploaded_by_id[id])):
             us = uploaded_by_id[p_id]
-            logging.warning("%s: %.1f  (%.1f)" % (p_id, mean(us), stddev(us)))
+            logging.warning("%s: %.1f  (%.1f)", p_id, mean(us), stddev(us))
 
         logging.warning("Completion rounds: avg (stddev)")
 
@@ -389,9 +555,12 @@ class Sim:
         opt_stddev = optionize(stddev)
         
         for p_id in sorted(self.peer_ids,
-                           key=lambda id: opt_mean(completion_by_id[id])):
+                           key=lambda id: none_first(opt_mean(completion_by_id[id]))):
             cs = completion_by_id[p_id]
-            logging.warning("%s: %s  (%s)" % (p_id, opt_mean(cs), opt_stddev(cs)))
+            logging.warning("%s: %s  (%s)", p_id, opt_mean(cs), opt_stddev(cs))
+
+        if conf.timing:
+            report_timings(summaries)
 
 
 
@@ -429,15 +598,21 @@ def parse_agents(args):
             
         
 
-def main(args):
+def report_timings(summaries):
+    """Log the phase and agent timings summed over all the iterations"""
+    timings = make_timings(True)
+    for (u, c, t) in summaries:
+        timings.merge(t)
+    logging.warning("======== TIMING ========")
+    logging.warning(timings.report())
+
+
+def make_parser():
+    """The OptionParser for sim.py's command line.  Other tools can use
+    make_parser().parse_args([]) to get the defaults."""
     usage_msg = "Usage:  %prog [options] PeerClass1[,count] PeerClass2[,count] ..."
     parser = OptionParser(usage=usage_msg)
 
-    def usage(msg):
-        print "Error: %s\n" % msg
-        parser.print_help()
-        sys.exit()
-    
     parser.add_option("--loglevel",
                       dest="loglevel", default="info",
                       help="Set the logging level: 'debug' or 'info'")
@@ -466,22 +641,67 @@ def main(args):
                       dest="iters", default=1, type="int",
                       help="Number of times to run simulation to get stats")
 
+    parser.add_option("--seed",
+                      dest="seed", default=None, type="int",
+                      help="Seed for the whole run; iterations and peers get seeds derived from it")
 
-    (options, args) = parser.parse_args()
+    parser.add_option("--workers",
+                      dest="workers", default=1, type="int",
+                      help="Number of processes to spread the iterations over")
 
-    # leftover args are class names, with optional counts:
-    # "Peer Seed[,4]"
+    parser.add_option("--engine",
+                      dest="engine", default="python",
+                      choices=["python", "numpy"],
+                      help="Piece-state engine: 'python' (lists) or 'numpy' (one peers x pieces matrix)")
 
-    if len(args) == 0:
-        # default
-        agents_to_run = ['Dummy', 'Dummy', 'Seed']
-    else:
-        try:
-            agents_to_run = parse_agents(args)
-        except ValueError, e:
-            usage(e)
-    
-    configure_logging(options.loglevel)
+    parser.add_option("--scheduler",
+                      dest="scheduler", default="all",
+                      choices=["all", "active"],
+                      help="'all' calls every peer every round; 'active' skips "
+                      "requests() for seeds and finished peers, and uploads() "
+                      "for peers nobody asked for data")
+
+    parser.add_option("--history-window",
+                      dest="history_window", default=0, type="int",
+                      help="Only keep this many recent rounds of history (0 keeps all)")
+
+    parser.add_option("--history-spill",
+                      dest="history_spill", default=None,
+                      help="With --history-window, pickle evicted rounds to PATH.<iteration> "
+                      "(ignored without one)")
+
+    parser.add_option("--cache-dir",
+                      dest="cache_dir", default=None,
+                      help="With --seed, cache each iteration's results in this directory")
+
+    parser.add_option("--cache-size",
+                      dest="cache_size", default=64, type="int",
+                      help="Maximum size of the result cache in MB")
+
+    parser.add_option("--trusted-agents",
+                      dest="trusted_agents", default="", metavar="CLASSES",
+                      help="Comma-separated agent classes whose requests and uploads "
+                      "are only validated on a sample of rounds")
+
+    parser.add_option("--validation-sample",
+                      dest="validation_sample", default=0.1, type="float",
+                      help="Share of calls validated for --trusted-agents")
+
+    parser.add_option("--profile",
+                      dest="profile", default=None, metavar="PATH",
+                      help="Run under cProfile and write the stats to PATH "
+                      "('--profile' alone writes out.prof; a PATH given "
+                      "as a separate arg must end in .prof)")
+
+    parser.add_option("--timing",
+                      dest="timing", action="store_true", default=False,
+                      help="Report time spent per phase and per agent class")
+
+    return parser
+
+
+def make_config(options, agents_to_run):
+    """Build the sim's Params from parsed options and a list of class names"""
     config = Params()
 
     config.add("agent_class_names", agents_to_run)
@@ -494,13 +714,64 @@ def main(args):
     config.add("min_up_bw", options.min_up_bw)
     config.add("max_up_bw", options.max_up_bw)
     config.add("iters", options.iters)
+    config.add("seed", options.seed)
+    config.add("workers", options.workers)
+    config.add("engine", options.engine)
+    config.add("scheduler", options.scheduler)
+    config.add("history_window", options.history_window)
+    config.add("history_spill", options.history_spill)
+    config.add("timing", options.timing)
+    config.add("trusted_agents",
+               frozenset(filter(None, options.trusted_agents.split(","))))
+    config.add("validation_sample", options.validation_sample)
+    config.add("cache_dir", options.cache_dir)
+    config.add("cache_size", options.cache_size)
+    return config
+
+
+def main(args):
+    parser = make_parser()
+
+    def usage(msg):
+        print("Error: %s\n" % msg)
+        parser.print_help()
+        sys.exit()
+
+    # optparse can't do optional values: a bare --profile takes the next
+    # arg only if it's a .prof path (so "--profile Seed" still runs Seed),
+    # and otherwise gets the default
+    args = args[1:]
+    for (i, a) in enumerate(args):
+        if a == "--profile":
+            if i + 1 < len(args) and args[i + 1].endswith(".prof"):
+                args[i:i + 2] = ["--profile=" + args[i + 1]]
+            else:
+                args[i] = "--profile=out.prof"
+            break
+    (options, args) = parser.parse_args(args)
+
+    # leftover args are class names, with optional counts:
+    # "Peer Seed[,4]"
+
+    if len(args) == 0:
+        # default
+        agents_to_run = ['Dummy', 'Dummy', 'Seed']
+    else:
+        try:
+            agents_to_run = parse_agents(args)
+        except ValueError as e:
+            usage(e)
+    
+    configure_logging(options.loglevel)
+    config = make_config(options, agents_to_run)
     
     sim = Sim(config)
-    sim.run_sim()
+    if options.profile:
+        import cProfile
+        cProfile.runctx('sim.run_sim()', globals(), locals(), options.profile)
+        logging.warning("Profile written to %s", options.profile)
+    else:
+        sim.run_sim()
 
 if __name__ == "__main__":
-
-    # The next two lines are for profiling...
-    import cProfile
-    cProfile.run('main(sys.argv)', 'out.prof')
-#    main(sys.argv)
+    main(sys.argv)
@@ -1,4 +1,7 @@
-#!/usr/bin/python
+#!/usr/bin/env python3
+
+from util import none_first
+
 
 class Stats:
     @staticmethod
@@ -10,13 +13,8 @@ class Stats:
         Returns:
         dict: peer_id -> total upload blocks used
         """
-        uploaded = dict((peer_id, 0) for peer_id in peer_ids)
-        for peer_id in peer_ids:
-            for ds in history.downloads[peer_id]:
-                for download in ds:
-                    uploaded[download.from_id] += download.blocks
-                
-        return uploaded
+        return dict((peer_id, history.uploaded_total[peer_id.num])
+                    for peer_id in peer_ids)
 
     @staticmethod
     def uploaded_blocks_str(peer_ids, history):
@@ -43,9 +41,8 @@ class Stats:
         """ Return a pretty stringified version of completion_rounds """
         d = Stats.completion_rounds(peer_ids, history)
 
-        k = lambda id: d[id]
         return "\n".join("%s: %s" % (id, d[id])
-                         for id in sorted(d.keys(), key=d.__getitem__))
+                         for id in sorted(d, key=lambda id: none_first(d[id])))
 
     @staticmethod
     def all_done_round(peer_ids, history):
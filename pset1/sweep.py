@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+
+"""
+Runs the simulator over a grid of configurations in one process pool and
+writes a single table of results.
+
+Takes every sim.py option as the base configuration, plus:
+
+    --vary OPTION=V1,V2,...   sweep a sim.py option (by its flag name)
+    --mix "Class[,count] ..."  an agent mix to sweep (repeatable)
+
+The grid is the cross product of all the --vary values and mixes.  Every
+(cell, iteration) pair is one task for the pool, so the workers import the
+agents once and stay busy however the cells differ in cost.  For example:
+
+    python sweep.py --seed 1 --iters 10 --max-round 200 --num-pieces 64 \\
+        --vary min-bw=4,16 --vary max-bw=32,64 \\
+        --mix "RSCTorrentStd,9 Seed" --mix "RSCTorrentTyrant,9 Seed" \\
+        --output sweep.csv
+
+One row per cell and agent class: the mean (and stddev) over peers and
+iterations of the blocks uploaded and of the round the peers finished, and
+the share of peers that finished.
+"""
+
+import sys
+import csv
+import time
+import logging
+import itertools
+import multiprocessing
+from optparse import Values, OptionValueError
+
+import sim
+from util import mean, stddev
+
+
+def parse_vary(parser, spec):
+    """"min-bw=4,8" -> ("min_up_bw", [4, 8]), converting the values with the
+    option's own type"""
+    try:
+        flag, values = spec.split("=", 1)
+    except ValueError:
+        raise ValueError("Bad --vary: %s (expected OPTION=V1,V2,...)" % spec)
+    option = parser.get_option("--" + flag.lstrip("-"))
+    if option is None or option.dest is None:
+        raise ValueError("Unknown sim option in --vary: %s" % flag)
+    return (option.dest, [option.check_value(flag, v) for v in values.split(",")])
+
+
+def make_cells(options, axes, mixes):
+    """
+    axes: [(dest, [values])]
+    mixes: [(mix name, [agent class names])]
+
+    Returns [(settings, mix name, config)], one per grid cell; settings is
+    the list of (dest, value) that the cell overrides.
+    """
+    cells = []
+    dests = [dest for (dest, values) in axes]
+    for values in itertools.product(*[values for (dest, values) in axes]):
+        settings = list(zip(dests, values))
+        cell_options = Values(options.__dict__)
+        cell_options._update_loose(dict(settings))
+        for (mix, agents) in mixes:
+            cells.append((settings, mix, sim.make_config(cell_options, agents)))
+    return cells
+
+
+def run_task(args):
+    """Pool entry point: args is (cell index, config, seed, iteration)"""
+    cell, config, seed, iteration = args
+    (uploaded, completion, timings) = sim.run_iteration((config, seed, iteration))
+    return (cell, iteration, uploaded, completion)
+
+
+def format_duration(seconds):
+    seconds = int(seconds)
+    return "%d:%02d:%02d" % (seconds // 3600, seconds // 60 % 60, seconds % 60)
+
+
+def report_progress(done, total, started):
+    elapsed = time.time() - started
+    eta = elapsed / done * (total - done)
+    sys.stderr.write("\r%d/%d iterations  %5.1f%%  elapsed %s  eta %s " % (
+        done, total, 100.0 * done / total,
+        format_duration(elapsed), format_duration(eta)))
+    if done == total:
+        sys.stderr.write("\n")
+    sys.stderr.flush()
+
+
+def summarize(settings, mix, config, results):
+    """
+    results: [(uploaded, completion)], one per iteration of the cell
+
+    Returns one row (a dict) per agent class in the cell's mix.
+    """
+    peer_ids = sim.make_peer_ids(config.agent_class_names)
+    class_of = dict(zip(peer_ids, config.agent_class_names))
+
+    rows = []
+    for name in sorted(set(config.agent_class_names)):
+        ids = [p for p in peer_ids if class_of[p] == name]
+        uploaded = [u[p] for (u, c) in results for p in ids]
+        finished = [c[p] for (u, c) in results for p in ids if c[p] is not None]
+        row = dict(settings)
+        row.update({
+            "mix": mix,
+            "agent": name,
+            "peers": len(ids),
+            "iters": len(results),
+            "uploaded_mean": mean(uploaded),
+            "uploaded_stddev": stddev(uploaded),
+            "finished_share": float(len(finished)) / len(uploaded),
+            "completion_mean": mean(finished) if finished else None,
+            "completion_stddev": stddev(finished) if finished else None,
+        })
+        rows.append(row)
+    return rows
+
+
+RESULT_COLUMNS = ["mix", "agent", "peers", "iters",
+                  "uploaded_mean", "uploaded_stddev", "finished_share",
+                  "completion_mean", "completion_stddev"]
+
+
+def print_table(rows, columns):
+    def fmt(v):
+        if v is None:
+            return "-"
+        if isinstance(v, float):
+            return "%.2f" % v
+        return str(v)
+
+    table = [columns] + [[fmt(row[c]) for c in columns] for row in rows]
+    widths = [max(len(r[i]) for r in table) for i in range(len(columns))]
+    for r in table:
+        print("  ".join(v.rjust(w) for (v, w) in zip(r, widths)))
+
+
+def make_sweep_parser():
+    parser = sim.make_parser()
+    parser.set_usage("Usage: %prog [sim options] [--vary OPTION=V1,V2,...] "
+                     "[--mix \"Class[,count] ...\"] [Class[,count] ...]")
+    parser.set_defaults(loglevel="warning",
+                        workers=multiprocessing.cpu_count())
+    parser.add_option("--vary",
+                      dest="vary", action="append", default=[],
+                      metavar="OPTION=V1,V2,...",
+                      help="Sweep a sim option over these values (repeatable)")
+    parser.add_option("--mix",
+                      dest="mixes", action="append", default=[],
+                      help="Agent mix to sweep, e.g. \"RSCTorrentStd,4 Seed\" (repeatable)")
+    parser.add_option("--output",
+                      dest="output", default=None,
+                      help="Write the results table as CSV to this file")
+    return parser
+
+
+def main(args):
+    parser = make_sweep_parser()
+    (options, args) = parser.parse_args(args[1:])
+
+    try:
+        axes = [parse_vary(parser, spec) for spec in options.vary]
+        mix_specs = options.mixes or [" ".join(args) or "Dummy,2 Seed"]
+        mixes = [(spec, sim.parse_agents(spec.split())) for spec in mix_specs]
+    except (ValueError, OptionValueError) as e:
+        parser.error(str(e))
+
+    sim.configure_logging(options.loglevel)
+    cells = make_cells(options, axes, mixes)
+    tasks = [(i, config, seed, iteration)
+             for (i, (settings, mix, config)) in enumerate(cells)
+             for (iteration, seed) in enumerate(sim.iteration_seeds(config))]
+    logging.warning("Sweeping %d cells, %d iterations on %d workers",
+                    len(cells), len(tasks), options.workers)
+
+    results = [[None] * config.iters for (settings, mix, config) in cells]
+    started = time.time()
+    pool = multiprocessing.Pool(options.workers)
+    try:
+        for (done, (i, iteration, uploaded, completion)) in enumerate(
+                pool.imap_unordered(run_task, tasks), 1):
+            results[i][iteration] = (uploaded, completion)
+            report_progress(done, len(tasks), started)
+    finally:
+        pool.close()
+        pool.join()
+
+    rows = []
+    for ((settings, mix, config), cell_results) in zip(cells, results):
+        rows.extend(summarize(settings, mix, config, cell_results))
+
+    columns = [dest for (dest, values) in axes] + RESULT_COLUMNS
+    print_table(rows, columns)
+    if options.output:
+        with open(options.output, "w", newline="") as f:
+            writer = csv.DictWriter(f, columns)
+            writer.writeheader()
+            writer.writerows(rows)
+
+
+if __name__ == "__main__":
+    main(sys.argv)
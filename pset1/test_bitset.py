@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+
+# Checks that Bitset behaves like the set of piece ids it replaced, for
+# numpy ids, ids past 64 and set operands.  Run with python -m pytest (or
+# unittest).
+
+import unittest
+
+import numpy as np
+
+from bitset import Bitset
+
+
+class BitsetTest(unittest.TestCase):
+    def test_numpy_and_large_ids(self):
+        ids = np.arange(0, 200, 7)
+        have = Bitset.from_ids(ids)
+        self.assertEqual(list(have), [int(i) for i in ids])
+        for i in range(-1, 210):
+            self.assertEqual(np.int64(i) in have, i in set(ids.tolist()), i)
+            self.assertEqual(i in have, np.int64(i) in have, i)
+        more = have.with_id(np.int64(150))
+        self.assertIn(150, more)
+        self.assertEqual(len(more), len(have) + 1)
+        self.assertEqual(len(more.with_id(np.int32(150))), len(more))
+
+    def test_mixed_operands(self):
+        a = {1, 5, 64, 100, 130}
+        b = {5, 64, 99, 130, 131}
+        bits = Bitset.from_ids(a)
+        for other in (b, frozenset(b), list(b), Bitset.from_ids(b)):
+            self.assertEqual(set(bits & other), a & b)
+            self.assertEqual(set(bits | other), a | b)
+            self.assertEqual(set(bits - other), a - b)
+            self.assertEqual(set(bits ^ other), a ^ b)
+            self.assertEqual(set(bits.intersection(other)), a & b)
+            self.assertEqual(set(bits.union(other)), a | b)
+            self.assertEqual(set(bits.difference(other)), a - b)
+            self.assertEqual(set(bits.symmetric_difference(other)), a ^ b)
+            self.assertEqual(bits.isdisjoint(other), a.isdisjoint(b))
+        # The set on the left
+        self.assertEqual(set(b & bits), a & b)
+        self.assertEqual(set(b | bits), a | b)
+        self.assertEqual(set(b - bits), b - a)
+        self.assertEqual(set(b ^ bits), a ^ b)
+        self.assertTrue(bits.issuperset({1, 64, 130}))
+        self.assertFalse(bits.issuperset(b))
+        self.assertTrue(bits.issubset(a | b))
+        self.assertTrue({1, 130} <= bits)
+        self.assertTrue(bits >= np.array([5, 100]))
+
+    def test_to_mask(self):
+        have = Bitset.from_ids([0, 63, 64, 99])
+        self.assertEqual(np.flatnonzero(have.to_mask(100)).tolist(),
+                         [0, 63, 64, 99])
+
+
+if __name__ == "__main__":
+    unittest.main()
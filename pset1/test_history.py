@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+
+# Checks DownloadLog's windowed totals against a naive sum over the rounds,
+# with and without rounds dropped.  Run with python -m pytest (or unittest).
+
+import random
+import unittest
+
+from history import DownloadLog
+from messages import Download
+
+
+def naive(rounds, n_rounds):
+    """(blocks, dict from_id -> blocks) over the last n_rounds of rounds"""
+    window = rounds[max(0, len(rounds) - n_rounds):] if n_rounds > 0 else []
+    total = 0
+    by_peer = dict()
+    for downloads in window:
+        for d in downloads:
+            total += d.blocks
+            by_peer[d.from_id] = by_peer.get(d.from_id, 0) + d.blocks
+    return (total, by_peer)
+
+
+class DownloadLogTest(unittest.TestCase):
+    def check(self, log, kept):
+        for n_rounds in range(-2, len(kept) + 3):
+            (total, by_peer) = naive(kept, n_rounds)
+            self.assertEqual(log.blocks_received(n_rounds), total, n_rounds)
+            self.assertEqual(log.received_from(n_rounds), by_peer, n_rounds)
+
+    def test_windows_match_naive_sums(self):
+        rng = random.Random(0)
+        log = DownloadLog()
+        kept = []
+        self.check(log, kept)
+        for r in range(30):
+            downloads = [Download("P%d" % rng.randrange(4), "me",
+                                  rng.randrange(10), rng.randrange(1, 5))
+                         for _ in range(rng.randrange(4))]
+            log.append_round(downloads)
+            kept.append(downloads)
+            if r % 3 == 2:
+                log.drop_oldest_round()
+                del kept[0]
+            self.check(log, kept)
+
+
+if __name__ == "__main__":
+    unittest.main()
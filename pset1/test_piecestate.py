@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+
+# Checks that the python and numpy piece-state engines agree, round by
+# round, on the same gains, fractional block counts included.  Run with
+# python -m pytest (or unittest).
+
+import random
+import unittest
+
+from arraystate import ArrayPieceState
+from peerids import PeerTable
+from piecestate import PieceState
+from util import Params
+
+
+def make_conf(num_pieces, blocks_per_piece):
+    conf = Params()
+    conf.add("num_pieces", num_pieces)
+    conf.add("blocks_per_piece", blocks_per_piece)
+    return conf
+
+
+class EngineEquivalenceTest(unittest.TestCase):
+    def run_engines(self, rng, bws):
+        conf = make_conf(6, 5)
+        ids = PeerTable(["Seed0", "P1", "P2", "P3"]).ids
+        init = [[5] * 6] + [[0] * 6 for _ in ids[1:]]
+        states = [PieceState(conf, ids, init),
+                  ArrayPieceState(conf, ids, init)]
+        for r in range(40):
+            gains = []
+            for pid in ids[1:]:
+                for piece_id in rng.sample(range(6), 2):
+                    left = 5 - states[0].blocks_of(pid, piece_id)
+                    if left > 0:
+                        gains.append((pid, piece_id, min(rng.choice(bws), left)))
+            done = []
+            for state in states:
+                state.add_blocks(gains)
+                done.append(state.pop_newly_done())
+                state.check_done()
+            (py, arr) = states
+            self.assertEqual(done[0], done[1], r)
+            self.assertEqual(py.remaining, arr.remaining, r)
+            self.assertEqual(list(py.rarity()), list(arr.rarity()), r)
+            for pid in ids:
+                self.assertEqual(list(py.pieces(pid)), list(arr.pieces(pid)))
+                self.assertEqual(py.available[pid.num], arr.available[pid.num])
+                for piece_id in range(6):
+                    self.assertEqual(py.blocks_of(pid, piece_id),
+                                     arr.blocks_of(pid, piece_id))
+
+    def test_whole_blocks(self):
+        self.run_engines(random.Random(0), [1, 2, 3])
+
+    def test_fractional_blocks(self):
+        self.run_engines(random.Random(1), [1, 2.5, 0.5, 1.25])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+
+# The per-peer estimates behind the RSCTorrentTyrant and RSCTorrentTourney
+# agents' uploads(), kept as numpy arrays so a round's update is a handful
+# of array operations rather than dict lookups per peer.  numpy is imported
+# inside the methods, like planner does.
+
+
+def greedy_fit(costs, cap):
+    """
+    Positions in costs (non-negative, in priority order) that a greedy pass
+    takes: each cost that, added to the costs taken before it, stays
+    strictly under cap.
+
+    Returns (positions, total of the costs taken).
+    """
+    import numpy as np
+    taken = []
+    total = 0.0
+    start = 0
+    while start < len(costs):
+        # Take the longest run from start that fits...
+        fits = np.cumsum(costs[start:]) + total < cap
+        n = len(fits) if fits.all() else int(fits.argmin())
+        if n > 0:
+            taken.extend(range(start, start + n))
+            total += float(costs[start:start + n].sum())
+        # ...then skip ahead to the next cost that still fits
+        rest = np.flatnonzero(costs[start + n + 1:] + total < cap)
+        if len(rest) == 0:
+            break
+        start += n + 1 + int(rest[0])
+    return taken, total
+
+
+class TyrantState:
+    """
+    What a Tyrant-style agent believes about every other peer j, indexed by
+    j's position in the peers the agent was first handed (the sim hands
+    them over in the same order every round):
+
+    down_bw: f_j, blocks per round we expect to get from j if we unchoke j
+    min_up_bw: T_j, what we think we must upload to j to be unchoked by j
+    conseq_unchoked: rounds in a row j has unchoked us
+    available: how many pieces j had last round
+    downloaded: blocks j downloaded last round (from anyone)
+    choking: whether j sent us nothing last round
+    """
+    def __init__(self, peer_ids, initializer, blocks_per_piece, init_spots=4):
+        """Every f_j and T_j start out at initializer"""
+        import numpy as np
+        self.ids = list(peer_ids)
+        self.index = dict((peer_id, i) for (i, peer_id) in enumerate(self.ids))
+        self.blocks_per_piece = blocks_per_piece
+        self.init_spots = init_spots
+        n = len(self.ids)
+        self.down_bw = np.full(n, float(initializer))
+        self.min_up_bw = np.full(n, float(initializer))
+        self.conseq_unchoked = np.zeros(n, dtype=np.int64)
+        self.available = None
+        self.downloaded = np.zeros(n, dtype=np.int64)
+        self.choking = np.zeros(n, dtype=bool)
+
+    def observe_pieces(self, peers):
+        """Record how many pieces each peer has; from the second call on,
+        the change since the last call gives downloaded"""
+        import numpy as np
+        counts = np.fromiter((len(peer.available_pieces) for peer in peers),
+                             dtype=np.int64, count=len(self.ids))
+        if self.available is not None:
+            self.downloaded = (counts - self.available) * self.blocks_per_piece
+        self.available = counts
+
+    def update(self, received, decay, growth):
+        """
+        Update f_j and T_j from last round's downloads.
+
+        received: dict : peer_id -> blocks we got from it last round
+            (history.received_from(1)); those peers unchoked us
+        decay: factor on T_j for peers that have unchoked us more than 2
+            rounds in a row
+        growth: factor on T_j for peers that choked us
+        """
+        import numpy as np
+        n = len(self.ids)
+        unchoked = np.zeros(n, dtype=bool)
+        blocks = np.zeros(n)
+        if received:
+            at = [self.index[peer_id] for peer_id in received]
+            unchoked[at] = True
+            blocks[at] = [float(b) for b in received.values()]
+
+        # Unchokers: we got f_j from them.  Chokers: guess they split what
+        # they downloaded over init_spots
+        self.down_bw = np.where(unchoked, blocks,
+                                self.downloaded / float(self.init_spots))
+        self.conseq_unchoked = np.where(unchoked, self.conseq_unchoked + 1, 0)
+        factor = np.where(unchoked,
+                          np.where(self.conseq_unchoked > 2, decay, 1.0),
+                          growth)
+        self.min_up_bw = factor * self.min_up_bw
+        self.choking = ~unchoked
+
+    def is_choking(self, peer_id):
+        return bool(self.choking[self.index[peer_id]])
+
+    def ratios(self):
+        """f_j / T_j, or 0 where T_j is 0"""
+        import numpy as np
+        ratios = np.zeros(len(self.ids))
+        np.divide(self.down_bw, self.min_up_bw, out=ratios,
+                  where=self.min_up_bw != 0)
+        return ratios
+
+    def allocate(self, requesters, cap, exclude=None):
+        """
+        Unchoke requesters by f_j / T_j, best first (ties in peer order),
+        giving each ceil(T_j) for as long as the total stays under cap.
+
+        Returns (chosen peer ids, their bandwidths, total bandwidth).
+        """
+        import numpy as np
+        wanted = np.zeros(len(self.ids), dtype=bool)
+        wanted[[self.index[peer_id] for peer_id in set(requesters)]] = True
+        if exclude is not None:
+            wanted[self.index[exclude]] = False
+
+        # A stable sort on -ratio keeps ties in peer order, like
+        # sorted(..., reverse=True) does
+        order = np.argsort(-self.ratios(), kind="stable")
+        order = order[wanted[order]]
+        costs = np.ceil(self.min_up_bw[order])
+        (taken, total) = greedy_fit(costs, cap)
+        chosen = [self.ids[i] for i in order[taken]]
+        bws = [int(c) for c in costs[taken]]
+        return (chosen, bws, total)
@@ -1,10 +1,12 @@
-#!/usr/bin/python
+#!/usr/bin/env python3
 
 # Util functions ################
 
 # http://stackoverflow.com/questions/5098580/implementing-argmax-in-python
 
-from itertools import imap, izip, count
+from itertools import count
+import hashlib
+import logging
 import math
 
 
@@ -12,14 +14,14 @@ def argmax(pairs):
     """
     given an iterable of pairs return the key corresponding to the greatest value
     """
-    return max(pairs, key=lambda (a,b): b)[0]
+    return max(pairs, key=lambda pair: pair[1])[0]
 
  
 def argmax_index(values):
     """
     given an iterable of values return the index of the greatest value
     """
-    return argmax(izip(count(), values))
+    return argmax(zip(count(), values))
 
 def argmax_f(keys, f):
     """
@@ -31,7 +33,7 @@ def argmax_f_tuples(keys, f):
     """
     given an iterable of key tuples and a function f, return the key with largest f(*key)
     """
-    return max(imap(lambda key: (f(*key), key), keys))[1]
+    return max((f(*key), key) for key in keys)[1]
 
 def mean(lst):
     """Throws a div by zero exception if list is empty"""
@@ -48,10 +50,10 @@ def median(numeric):
     vals = sorted(numeric)
     count = len(vals)
     if count % 2 == 1:
-        return vals[(count+1)/2-1]
+        return vals[(count+1)//2-1]
     else:
-        lower = vals[count/2-1]
-        upper = vals[count/2]
+        lower = vals[count//2-1]
+        upper = vals[count//2]
         return (float(lower + upper)) / 2
 
 def even_split(n, k):
@@ -79,13 +81,65 @@ def even_split(n, k):
         raise TypeError("n and k must be ints")
 
     r = n % k
-    ans = ([n/k] * (k-r))
-    ans.extend([n/k + 1] * r)
+    ans = ([n//k] * (k-r))
+    ans.extend([n//k + 1] * r)
     return ans
 
 
+def none_first(value):
+    """Sort key for numbers that may be None (e.g. a peer's completion
+    round).  None goes before every number."""
+    return (value is not None, value)
+
+
+def unique(lst):
+    """The elements of lst without repeats, in the order first seen.  Use it
+    instead of list(set(lst)) when the order matters: set order of strings
+    changes from run to run."""
+    seen = set()
+    ans = []
+    for x in lst:
+        if x not in seen:
+            seen.add(x)
+            ans.append(x)
+    return ans
+
+
+def derive_seed(seed, *keys):
+    """
+    Deterministically derive a 32-bit seed from seed and keys (ints or
+    strings), e.g. derive_seed(run_seed, iteration) or
+    derive_seed(iteration_seed, peer_id).  Same inputs, same seed, whatever
+    order things run in.
+    """
+    text = ":".join(str(k) for k in (seed,) + keys)
+    return int(hashlib.sha1(text.encode("ascii")).hexdigest()[:8], 16)
+
+
+def log_enabled(level):
+    """Would the root logger emit a record at this level?  Use it to guard
+    logging that's expensive to even set up (loops, big joins)."""
+    return logging.getLogger().isEnabledFor(level)
+
+
+class LazyStr:
+    """
+    Pass as a logging argument to put off calling f(*args) until a handler
+    actually formats the record:
+
+        logging.info("Game history:\n%s", LazyStr(history.pretty))
+    """
+    def __init__(self, f, *args):
+        self.f = f
+        self.args = args
+
+    def __str__(self):
+        return str(self.f(*self.args))
+
+
 def load_modules(agent_classes):
     """Each agent class must be in module class_name.lower().
+    Only the modules of the named classes are imported.
     Returns a dictionary class_name->class"""
 
     def load(class_name):
@@ -94,7 +148,8 @@ def load_modules(agent_classes):
         agent_class = module.__dict__[class_name]
         return (class_name, agent_class)
 
-    return dict(map(load, agent_classes))
+    # Each named class once, however many peers run it
+    return dict(map(load, unique(agent_classes)))
     
 
 